@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+import os
+import logging
+import sys
+import argparse
+
+from twisted.internet import reactor
+
+# add the project to the python path and inport it
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from softdev import log
+from bobcats import ioc, journal
+
+parser = argparse.ArgumentParser(description='Replay a BobCATS journal through an offline IOC')
+parser.add_argument('-v', action='store_true', help='Verbose Logging')
+parser.add_argument('-d', '--device', type=str, help='Device Name', default='REPLAY1608-000')
+parser.add_argument('--speed', type=float, help='Replay speed relative to real time, as fast as possible if omitted')
+parser.add_argument('--dump', action='store_true', help='Print the records instead of replaying them')
+parser.add_argument('journal', type=str, help='Journal file')
+
+args = parser.parse_args()
+
+
+def summarize(replayer, rate=None):
+    counts = ', '.join(
+        '{} {}'.format(count, name) for name, count in zip(journal.KIND_NAMES, replayer.counts)
+    )
+    if rate:
+        print('Replayed {} at {:0.0f} records/s'.format(counts, rate))
+    else:
+        print('Replayed {}'.format(counts))
+
+
+if __name__ == '__main__':
+    if args.v:
+        log.log_to_console(logging.DEBUG)
+    else:
+        log.log_to_console(logging.WARNING)
+
+    if args.dump:
+        for timestamp, kind, text in journal.read_journal(args.journal):
+            print('{:0.6f} {:<8} {}'.format(timestamp, journal.KIND_NAMES[kind], text))
+        sys.exit(0)
+
+    app = ioc.BobCATSApp(args.device, None)
+    replayer = journal.Replayer(app, args.journal)
+    if args.speed:
+        done = replayer.schedule(args.speed)
+        done.addCallback(lambda count: summarize(replayer))
+        done.addBoth(lambda result: reactor.stop())
+        reactor.addSystemEventTrigger('before', 'shutdown', app.shutdown)
+        reactor.run()
+    else:
+        try:
+            summarize(replayer, replayer.run())
+        finally:
+            app.shutdown()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+import os
+import logging
+import sys
+import argparse
+
+# add the project to the python path and inport it
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from softdev import log
+from bobcats import bench
+
+parser = argparse.ArgumentParser(description='Benchmark the status and command hot paths')
+parser.add_argument('-v', action='store_true', help='Verbose Logging')
+parser.add_argument('-d', '--device', type=str, help='Device Name', default='BENCH1608-000')
+parser.add_argument('-n', '--count', type=int, help='Number of synthetic status messages', default=20000)
+parser.add_argument('--commands', type=int, help='Number of command round-trips', default=1000)
+parser.add_argument('--input', type=str, help='Recorded status replies, one per line')
+parser.add_argument('--save', type=str, help='Save results as a baseline file')
+parser.add_argument('--compare', type=str, help='Compare results against a baseline file')
+parser.add_argument('--tolerance', type=float, help='Regression tolerance', default=bench.TOLERANCE)
+
+args = parser.parse_args()
+
+if __name__ == '__main__':
+    if args.v:
+        log.log_to_console(logging.DEBUG)
+    else:
+        log.log_to_console(logging.WARNING)
+
+    if args.input:
+        messages = bench.load_messages(args.input)
+    else:
+        messages = bench.synthetic_messages(args.count)
+
+    benchmark = bench.Benchmark(args.device)
+    try:
+        results = benchmark.run(messages, commands=args.commands)
+    finally:
+        benchmark.app.shutdown()
+    print(bench.report(results))
+
+    if args.save:
+        bench.save(results, args.save)
+    if args.compare:
+        regressions = bench.compare(results, bench.load(args.compare), tolerance=args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: {}'.format(regression))
+        sys.exit(1 if regressions else 0)
@@ -1,28 +1,64 @@
 #!/usr/bin/env python
+import time
+START_TIME = time.time()
+
 import os
 import logging
 import sys
 import argparse
 
+# The reactor must be installed before anything imports it
+backend_parser = argparse.ArgumentParser(add_help=False)
+backend_parser.add_argument(
+    '--backend', choices=('gi', 'asyncio'), default='gi',
+    help='Event loop: GLib (default) or a headless asyncio loop with asyncio controller links (Python 3)'
+)
+backend = backend_parser.parse_known_args()[0].backend
+
 # Twisted boiler-plate code.
-from twisted.internet import gireactor
-gireactor.install()
+if backend == 'asyncio':
+    import asyncio
+    from twisted.internet import asyncioreactor
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    asyncioreactor.install(loop)
+else:
+    from twisted.internet import gireactor
+    gireactor.install()
 from twisted.internet import reactor
 
 # add the project to the python path and inport it
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from softdev import log
-from bobcats import ioc
+from bobcats import ioc, fleet, metrics, cats
+IMPORT_TIME = time.time()
+logger = log.get_module_logger('runIOC')
 
 # Setup single argument for verbose logging
-parser = argparse.ArgumentParser(description='Run IOC Application')
+parser = argparse.ArgumentParser(description='Run IOC Application', parents=[backend_parser])
 parser.add_argument('-v', action='store_true', help='Verbose Logging')
-parser.add_argument('-d', '--device', type=str, help='Device Name', required=True)
-parser.add_argument('--address', type=str, help='Controller address', required=True)
-parser.add_argument('--commands', type=int, help='Command Port', required=True)
-parser.add_argument('--status', type=int, help='Status Port', required=True)
+parser.add_argument('-c', '--config', type=str, help='Configuration file listing several robots')
+parser.add_argument('-d', '--device', type=str, help='Device Name')
+parser.add_argument('--address', type=str, help='Controller address')
+parser.add_argument('--commands', type=int, help='Command Port')
+parser.add_argument('--status', type=int, help='Status Port')
+parser.add_argument('--metrics', type=int, help='Serve metrics for scraping on this localhost port')
+parser.add_argument('--link-timeout', type=float,
+                    help='Seconds without status replies before reconnecting both links (default {})'.format(cats.LINK_TIMEOUT))
+parser.add_argument('--max-delay', type=float,
+                    help='Maximum seconds between reconnection attempts (default {})'.format(cats.MAX_DELAY))
+parser.add_argument('--io-map', type=str, help='INI file naming the digital input and output bits')
+parser.add_argument('--journal', type=str, help='Record commands, responses and status changes to a journal file')
 
 args = parser.parse_args()
+if not args.config and None in (args.device, args.address, args.commands, args.status):
+    parser.error('either --config or all of --device, --address, --commands and --status are required')
+if args.config:
+    # link options and bit maps are set per robot in the configuration file, journals only record single robots
+    options = ('journal', 'io_map', 'link_timeout', 'max_delay')
+    conflicts = ['--{}'.format(name.replace('_', '-')) for name in options if getattr(args, name) is not None]
+    if conflicts:
+        parser.error('{} cannot be used with --config'.format(', '.join(conflicts)))
    
 # Example of how to start your APP. Modify as needed
 
@@ -31,8 +67,20 @@ if __name__== '__main__':
         log.log_to_console(logging.DEBUG)
     else:
         log.log_to_console(logging.INFO)
+    logger.info('Startup: imports completed after {:0.3f} s'.format(IMPORT_TIME - START_TIME))
 
-    app = ioc.BobCATSApp(args.device, args.address, args.commands, args.status)  # initialize App
+    link_backend = 'asyncio' if backend == 'asyncio' else 'twisted'
+    if args.config:
+        app = fleet.Fleet(fleet.load_config(args.config), backend=link_backend)  # initialize all robots
+    else:
+        app = ioc.BobCATSApp(
+            args.device, args.address, args.commands, args.status, journal_file=args.journal,
+            link_timeout=cats.LINK_TIMEOUT if args.link_timeout is None else args.link_timeout,
+            max_delay=cats.MAX_DELAY if args.max_delay is None else args.max_delay, backend=link_backend,
+            io_map=args.io_map
+        )  # initialize App
+    if args.metrics:
+        registries = [robot.metrics for robot in app.apps] if args.config else [app.metrics]
+        metrics.serve(registries, args.metrics)
     reactor.addSystemEventTrigger('before', 'shutdown', app.shutdown) # make sure app is properly shutdown
     reactor.run()               # run main-loop
-
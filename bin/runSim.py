@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+import os
+import logging
+import sys
+import argparse
+
+from twisted.internet import reactor
+
+# add the project to the python path and inport it
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from softdev import log
+from bobcats import simulator
+
+parser = argparse.ArgumentParser(description='Run simulated CATS controller')
+parser.add_argument('-v', action='store_true', help='Verbose Logging')
+parser.add_argument('--commands', type=int, help='Command Port', default=1000)
+parser.add_argument('--status', type=int, help='Status Port', default=10000)
+parser.add_argument('--delay', type=float, help='Mean reply delay (sec)', default=0.0)
+parser.add_argument('--jitter', type=float, help='Reply delay jitter (sec)', default=0.0)
+parser.add_argument('--drop', type=float, help='Fraction of requests dropped', default=0.0)
+parser.add_argument('--mount-time', type=float, help='Put/Get trajectory duration (sec)', default=simulator.MOUNT_TIME)
+
+args = parser.parse_args()
+
+if __name__ == '__main__':
+    if args.v:
+        log.log_to_console(logging.DEBUG)
+    else:
+        log.log_to_console(logging.INFO)
+
+    simulator.serve(
+        args.commands, args.status, delay=args.delay, jitter=args.jitter, drop=args.drop,
+        mount_time=args.mount_time
+    )
+    reactor.run()
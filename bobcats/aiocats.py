@@ -0,0 +1,271 @@
+import asyncio
+import random
+import time
+
+from softdev import log
+
+from .cats import (
+    MessageType, CommandTracker, PendingCommand, LINK_TIMEOUT, INITIAL_DELAY, MAX_DELAY, BACKOFF_FACTOR,
+    BACKOFF_JITTER, split_frames, encode_message, set_keepalive
+)
+from .polling import PollScheduler
+
+logger = log.get_module_logger(__name__)
+
+# Python 3 only, asyncio implementation of the CATS links
+
+POLL_TIME = 0.05        # seconds between status polling ticks
+READ_SIZE = 64 * 1024   # maximum bytes read from a link at once
+LINK_NAMES = {MessageType.RESPONSE: 'CATS Command Link', MessageType.STATUS: 'CATS Status Link'}
+
+
+class LinkClient(object):
+    """
+    One CATS link on asyncio streams, with the interface of cats.CommandFactory. The link reconnects
+    with a jittered exponential backoff and reports connections, disconnections and received messages
+    to the application.
+
+    :param application: object providing connect, disconnect and receive_message
+    :param message_type: MessageType of the messages received on this link
+    :param initial_delay: seconds before the first reconnection attempt
+    :param max_delay: maximum seconds between reconnection attempts
+    :param jitter: random fraction by which each reconnection delay is varied
+    """
+
+    def __init__(self, application, message_type, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY,
+                 jitter=BACKOFF_JITTER):
+        self.application = application
+        self.message_type = message_type
+        self.name = LINK_NAMES[message_type]
+        self.initial_delay = self.delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.ready = False
+        self.writer = None
+        self.task = None
+        self.buffer = bytearray()
+        self.frames = {}
+        self.commands = CommandTracker(self.call_later, self.resolve_command, self.reject_command)
+        self.pending = self.commands.pending
+        self.latency = self.commands.latency
+        self.received = 0
+        self.sent = 0
+        self.connections = 0
+        self.last_received = 0.0
+
+    def start(self, host, port):
+        """
+        Connect to the controller and keep reconnecting until stopped.
+        """
+        self.task = asyncio.ensure_future(self.run(host, port))
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self, host, port):
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as e:
+                logger.debug('Connection to {}:{} failed: {}'.format(host, port, e))
+                self.on_disconnect()
+            else:
+                self.delay = self.initial_delay
+                await self.serve(reader, writer)
+            delay = self.delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.delay = min(self.delay * BACKOFF_FACTOR, self.max_delay)
+            await asyncio.sleep(delay)
+
+    async def serve(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            set_keepalive(sock)
+        self.writer = writer
+        self.connections += 1
+        self.ready = True
+        logger.warning('{} Connected!'.format(self.name))
+        self.application.connect(self.message_type)
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.buffer.extend(data)
+                for message in split_frames(self.buffer):
+                    self.receive_message(message)
+        except OSError as e:
+            logger.warning('{} Error: {}'.format(self.name, e))
+        finally:
+            self.ready = False
+            self.writer = None
+            del self.buffer[:]
+            writer.close()
+            logger.warning('{} Disconnected'.format(self.name))
+            self.on_disconnect()
+
+    def drop(self):
+        """
+        Abort the connection so that it is re-established with the initial reconnection delay.
+        """
+        self.delay = self.initial_delay
+        if self.writer is not None:
+            self.writer.transport.abort()
+
+    def send_message(self, message):
+        if self.ready and self.writer is not None:
+            self.sent += 1
+            self.writer.write(encode_message(message, self.frames))
+        else:
+            logger.error('Client not connected. Command ignored!')
+
+    def send_command(self, message):
+        """
+        Send a command and track its response.
+
+        :param message: formatted command
+        :return: awaitable Future which resolves to the response, or fails with CommandTimeout if no
+            response arrives within the timeout for the command type
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not (self.ready and self.writer is not None):
+            future.set_exception(ConnectionError('Client not connected. Command ignored!'))
+            return future
+        self.commands.track(PendingCommand(message, future))
+        self.send_message(message)
+        return future
+
+    @staticmethod
+    def call_later(delay, func, *args):
+        return asyncio.get_event_loop().call_later(delay, func, *args)
+
+    @staticmethod
+    def resolve_command(command, message):
+        if not command.result.done():
+            command.result.set_result(message)
+
+    @staticmethod
+    def reject_command(command, reason):
+        if not command.result.done():
+            command.result.set_exception(reason)
+
+    def receive_message(self, message):
+        self.received += 1
+        self.last_received = time.time()
+        # errors in message handlers must not end the connection task
+        try:
+            if self.message_type == MessageType.RESPONSE and self.pending:
+                self.commands.complete(message)
+            self.application.receive_message(message, self.message_type)
+        except Exception as e:
+            logger.error(e)
+
+    def on_disconnect(self):
+        self.commands.fail_all(ConnectionError('{} lost'.format(self.name)))
+        self.application.disconnect(self.message_type)
+
+
+class CATSClient(object):
+    """
+    Headless asyncio client for a CATS controller, for use outside of the IOC. Status is polled
+    continuously and the latest reply of each status query is kept. For example::
+
+        client = CATSClient('cats1.example.com')
+        client.start()
+        await client.connected(timeout=10)
+        response = await client.send_command('put(2,1,21,0,0,0,0,0,0,0,0,0,0)')
+        state = client.replies.get('state')
+
+    :param host: controller address
+    :param command_port: command port
+    :param status_port: status port
+    :param on_message: optional callable receiving every message and its MessageType
+    :param link_timeout: seconds without status replies before both links are re-established
+    :param max_delay: maximum seconds between reconnection attempts
+    """
+
+    def __init__(self, host, command_port=1000, status_port=10000, on_message=None, link_timeout=LINK_TIMEOUT,
+                 max_delay=MAX_DELAY):
+        self.host = host
+        self.command_port = command_port
+        self.status_port = status_port
+        self.on_message = on_message
+        self.link_timeout = link_timeout
+        self.link_time = 0
+        self.command_client = LinkClient(self, MessageType.RESPONSE, max_delay=max_delay)
+        self.status_client = LinkClient(self, MessageType.STATUS, max_delay=max_delay)
+        self.pending_clients = {MessageType.RESPONSE, MessageType.STATUS}
+        self.poller = PollScheduler()
+        self.replies = {}
+        self.ready = False
+        self.ready_event = asyncio.Event()
+        self.polling = None
+
+    def start(self):
+        self.command_client.start(self.host, self.command_port)
+        self.status_client.start(self.host, self.status_port)
+        self.polling = asyncio.ensure_future(self.poll())
+
+    def stop(self):
+        self.command_client.stop()
+        self.status_client.stop()
+        if self.polling is not None:
+            self.polling.cancel()
+            self.polling = None
+
+    async def connected(self, timeout=None):
+        """
+        Wait until both links are connected.
+        """
+        await asyncio.wait_for(self.ready_event.wait(), timeout)
+
+    def connect(self, message_type):
+        self.pending_clients.discard(message_type)
+        if not self.pending_clients:
+            self.poller.reset()
+            self.replies.clear()
+            self.ready = True
+            self.link_time = time.time()
+            self.ready_event.set()
+
+    def disconnect(self, message_type):
+        self.pending_clients.add(message_type)
+        self.ready_event.clear()
+        if self.ready:
+            # reconnect both links together
+            self.ready = False
+            self.command_client.drop()
+            self.status_client.drop()
+
+    def receive_message(self, message, message_type):
+        if message_type == MessageType.STATUS:
+            context = message.split('(', 1)[0]
+            self.replies[context] = message
+            self.poller.replied(context)
+        if self.on_message is not None:
+            self.on_message(message, message_type)
+
+    def send_command(self, message):
+        """
+        Send a command.
+
+        :param message: formatted command, e.g. 'put(2,1,21,0,0,0,0,0,0,0,0,0,0)'
+        :return: awaitable Future which resolves to the response
+        """
+        self.poller.wake()
+        return self.command_client.send_command(message)
+
+    async def poll(self):
+        while True:
+            if self.ready:
+                last = max(self.status_client.last_received, self.link_time)
+                if time.time() - last > self.link_timeout:
+                    logger.error('No status for {:0.1f} s, re-establishing links'.format(time.time() - last))
+                    self.disconnect(MessageType.STATUS)
+                else:
+                    for query in self.poller.due_queries():
+                        self.status_client.send_message(query)
+            await asyncio.sleep(POLL_TIME)
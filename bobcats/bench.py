@@ -0,0 +1,259 @@
+import gc
+import json
+import random
+import timeit
+from collections import defaultdict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    from twisted.internet.testing import StringTransport
+except ImportError:
+    from twisted.test.proto_helpers import StringTransport
+
+from softdev import log
+from twisted.internet import reactor
+from . import ioc
+
+logger = log.get_module_logger(__name__)
+
+clock = timeit.default_timer
+TOLERANCE = 0.1     # fractional change treated as a regression
+PERCENTILES = (50, 95, 99)
+MOUNT_ARGS = (2, 1, 21) + 10 * (0,)
+
+
+def synthetic_messages(count, change_rate=0.1, seed=0):
+    """
+    Generate status replies resembling those of an active robot.
+
+    :param count: number of messages
+    :param change_rate: probability that a reply differs from the previous one of the same kind
+    :param seed: random seed so that runs are repeatable
+    :return: list of status reply lines
+    """
+    rng = random.Random(seed)
+    state = ['1', '1', '1', '2', '', '0', '0', '0', '0', '0', '0', '0', '', '0', '1', '1', '100',
+             '111111111', '000000000', '0', '0']
+    inputs = ['0'] * 40
+    outputs = ['0'] * 40
+    position = [0.0, 300.0, 500.0, 180.0, 0.0, 90.0]
+    messages = []
+    for i in range(count):
+        kind = i % 4
+        changed = rng.random() < change_rate
+        if kind == 0:
+            if changed:
+                state[13] = '1' if state[13] == '0' else '0'
+                state[4] = 'put' if state[13] == '1' else ''
+                state[8] = state[9] = str(rng.randint(1, 30))
+            messages.append('state({})'.format(','.join(state)))
+        elif kind == 1:
+            if changed:
+                bit = rng.randrange(len(inputs))
+                inputs[bit] = '1' if inputs[bit] == '0' else '0'
+            messages.append('di({})'.format(','.join(inputs)))
+        elif kind == 2:
+            if changed:
+                bit = rng.randrange(len(outputs))
+                outputs[bit] = '1' if outputs[bit] == '0' else '0'
+            messages.append('do({})'.format(','.join(outputs)))
+        else:
+            if changed:
+                position = [coord + rng.uniform(-5, 5) for coord in position]
+            messages.append('position({})'.format(','.join('{:0.3f}'.format(coord) for coord in position)))
+    return messages
+
+
+def load_messages(filename):
+    """
+    Load recorded status replies, one per line.
+    """
+    with open(filename) as handle:
+        return [line.strip() for line in handle if line.strip()]
+
+
+def percentiles(samples):
+    if not samples:
+        return {str(pct): 0.0 for pct in PERCENTILES}
+    values = sorted(samples)
+    return {
+        str(pct): values[min(len(values) - 1, int(round(pct * (len(values) - 1) / 100.0)))] * 1e6
+        for pct in PERCENTILES
+    }
+
+
+class StageTimer(object):
+    """
+    Records the duration of every call to selected methods.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.originals = []
+
+    def wrap(self, obj, name, stage):
+        original = getattr(obj, name)
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(clock() - start)
+
+        self.originals.append((obj, name, original, name in vars(obj)))
+        setattr(obj, name, timed)
+
+    def restore(self):
+        for obj, name, original, own in reversed(self.originals):
+            if own:
+                setattr(obj, name, original)
+            else:
+                delattr(obj, name)
+        self.originals = []
+
+    def report(self):
+        return {stage: percentiles(samples) for stage, samples in self.samples.items()}
+
+
+class Benchmark(object):
+    """
+    Feeds status replies and command round-trips through an offline BobCATSApp with the link
+    protocols connected to in-memory transports.
+
+    :param device: device name for the offline IOC
+    """
+
+    def __init__(self, device):
+        self.app = ioc.BobCATSApp(device, None)
+        self.status = self.app.status_client.buildProtocol(None)
+        self.status.makeConnection(StringTransport())
+        self.command = self.app.command_client.buildProtocol(None)
+        self.command.makeConnection(StringTransport())
+        reactor.runUntilCurrent()   # run the delayed start of status polling scheduled by connect
+        for monitor in (self.app.monitor, self.app.link_monitor, self.app.metrics_monitor):
+            # periodic polling would otherwise run within the timed stages
+            if monitor.running:
+                monitor.stop()
+
+    def feed(self, lines):
+        for line in lines:
+            self.status.dataReceived(line)
+            reactor.runUntilCurrent()   # dispatch the inbox as the running reactor would
+
+    def round_trip(self, count):
+        # commands go through the outbox and the sender as they do from the command PVs
+        reply = '{}\r\n'.format(ioc.format_command('put', *MOUNT_ARGS)).encode('ascii')
+        for i in range(count):
+            if not self.app.send_command('put', *MOUNT_ARGS):
+                raise RuntimeError('Command rejected by the offline IOC')
+            reactor.runUntilCurrent()   # run the sender queued by send_command
+            self.command.dataReceived(reply)
+            reactor.runUntilCurrent()
+            self.app.profiler.reset()   # no path runs, close the profiled operation as a state reply would
+        self.command.transport.clear()
+
+    def throughput(self, func, count):
+        gc.collect()
+        start = clock()
+        func()
+        return count / (clock() - start)
+
+    def allocations(self, func, count):
+        if tracemalloc is None:
+            return {}
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        func()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, 'filename')
+        return {
+            'blocks': sum(stat.count_diff for stat in stats) / float(count),
+            'bytes': sum(stat.size_diff for stat in stats) / float(count),
+        }
+
+    def run(self, messages, commands=1000):
+        """
+        Run the benchmark.
+
+        :param messages: status reply lines
+        :param commands: number of command round-trips
+        :return: dictionary of results
+        """
+        lines = ['{}\r\n'.format(message).encode('ascii') for message in messages]
+        count = len(lines)
+        self.feed(lines)  # warm up the decoder caches
+        results = {
+            'messages': count,
+            'status_rate': self.throughput(lambda: self.feed(lines), count),
+            'command_rate': self.throughput(lambda: self.round_trip(commands), commands),
+            'allocations': self.allocations(lambda: self.feed(lines), count),
+        }
+
+        timer = StageTimer()
+        timer.wrap(self.status, 'dataReceived', 'receive')
+        timer.wrap(self.app, 'receiver', 'dispatch')
+        timer.wrap(self.app, 'process_message', 'process')
+        timer.wrap(self.app, 'parse_status', 'parse')
+        timer.wrap(self.app.decoder, 'publish', 'publish')
+        timer.wrap(self.app, 'send_command', 'queue')
+        timer.wrap(ioc, 'format_command', 'format')
+        timer.wrap(self.app.command_client, 'send_command', 'send')
+        try:
+            self.feed(lines)
+            self.round_trip(commands)
+        finally:
+            timer.restore()
+        results['stages'] = timer.report()
+        return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare benchmark results against a baseline.
+
+    :return: list of regression descriptions, empty if there are none
+    """
+    regressions = []
+    for key in ('status_rate', 'command_rate'):
+        if key in baseline and results[key] < baseline[key] * (1 - tolerance):
+            regressions.append('{}: {:0.0f}/s, baseline {:0.0f}/s'.format(key, results[key], baseline[key]))
+    for stage, values in results['stages'].items():
+        reference = baseline.get('stages', {}).get(stage, {}).get('95')
+        if reference and values['95'] > reference * (1 + tolerance):
+            regressions.append(
+                '{} p95: {:0.1f} us, baseline {:0.1f} us'.format(stage, values['95'], reference)
+            )
+    return regressions
+
+
+def report(results):
+    lines = [
+        'Status messages:  {:>12.0f} msg/s ({} messages)'.format(results['status_rate'], results['messages']),
+        'Command trips:    {:>12.0f} cmd/s'.format(results['command_rate']),
+    ]
+    if results['allocations']:
+        lines.append('Allocations:      {:>12.2f} blocks/msg {:>10.1f} bytes/msg'.format(
+            results['allocations']['blocks'], results['allocations']['bytes']
+        ))
+    lines.append('{:<12} {:>10} {:>10} {:>10}'.format('Stage (us)', 'p50', 'p95', 'p99'))
+    for stage, values in sorted(results['stages'].items()):
+        lines.append('{:<12} {:>10.1f} {:>10.1f} {:>10.1f}'.format(stage, values['50'], values['95'], values['99']))
+    return '\n'.join(lines)
+
+
+def save(results, filename):
+    with open(filename, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as handle:
+        return json.load(handle)
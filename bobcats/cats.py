@@ -1,36 +1,257 @@
 import re
+import socket
+import time
+from collections import deque
 from enum import Enum
 from softdev import log
-from twisted.internet import reactor, protocol
-from twisted.protocols.basic import LineReceiver
+from twisted.internet import reactor, protocol, defer, error
 
 logger = log.get_module_logger(__name__)
 
+COMMAND_TIMEOUT = 5.0   # default seconds to wait for a command response
+COMMAND_TIMEOUTS = {
+    'put': 10.0, 'get': 10.0, 'getput': 10.0, 'putplate': 10.0, 'getplate': 10.0, 'getputplate': 10.0,
+}
+TRAJECTORY_COMMANDS = ('put', 'get', 'getput', 'putplate', 'getplate', 'getputplate')
+LATENCY_WINDOW = 100    # number of recent round-trip times used for percentiles
+
+LINK_TIMEOUT = 3.0      # seconds without status replies before both links are declared down
+INITIAL_DELAY = 0.5     # seconds before the first reconnection attempt
+MAX_DELAY = 10.0        # maximum seconds between reconnection attempts
+BACKOFF_FACTOR = 2.0    # growth of the reconnection delay after each failed attempt
+BACKOFF_JITTER = 0.2    # random fraction by which each reconnection delay is varied
+KEEPALIVE_IDLE = 2      # seconds of silence before TCP keepalive probes are sent
+KEEPALIVE_INTERVAL = 1  # seconds between TCP keepalive probes
+KEEPALIVE_COUNT = 3     # unanswered probes before the connection is dropped by the kernel
+
+TERMINATOR = b'\r\n'    # appended to every outgoing message
+MAX_FRAME = 64 * 1024   # bytes of unterminated data kept before the receive buffer is discarded
+FRAME_CACHE = 256       # number of encoded outgoing messages kept for reuse
+
+# a frame ends at the first CR or LF, also within the field list of a context(...) reply
+FRAME = re.compile(br'([^\r\n]*)[\r\n]')
+
+if str is bytes:
+    def to_text(data):
+        # frames are bytearray slices, messages must be hashable native strings
+        return bytes(data)
+else:
+    def to_text(data):
+        return data.decode('latin-1')
+
 
 class MessageType(Enum):
     RESPONSE, STATUS = range(2)
 
 
-class CommandProtocol(LineReceiver):
+class CommandTimeout(Exception):
+    pass
+
+
+def is_error(reply):
+    # the controller answers commands it rejects with 'Error: <reason>'
+    return reply.lstrip().lower().startswith('error')
+
+
+class CommandStats(object):
+    """
+    Round-trip latency statistics for one command type
+    """
+
+    def __init__(self):
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.timeouts = 0
+
+    def add(self, latency):
+        self.samples.append(latency)
+        self.count += 1
+        self.total += latency
+        self.last = latency
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(round(pct * (len(values) - 1) / 100.0)))]
+
+
+def split_frames(buffer):
+    """
+    Extract the messages of all complete frames from a receive buffer. The frames are removed from
+    the buffer and an incomplete frame is left in place.
+
+    A reply with an unbalanced parenthesis does not swallow the frames which follow it::
+
+        >>> split_frames(bytearray(b'Error: unknown command put(1\\r\\nstate(1,1,1)\\r\\ndi(0,1)\\r\\n'))
+        ['Error: unknown command put(1', 'state(1,1,1)', 'di(0,1)']
+
+    :param buffer: bytearray of received data
+    :return: list of messages
+    """
+    messages = []
+    end = 0
+    match = FRAME.match(buffer)
+    while match:
+        end = match.end()
+        frame = match.group(1)
+        if frame:
+            message = to_text(frame).strip()
+            if message:
+                messages.append(message)
+        match = FRAME.match(buffer, end)
+    if end:
+        del buffer[:end]
+    if len(buffer) > MAX_FRAME:
+        logger.error('Discarding {} bytes of unterminated data'.format(len(buffer)))
+        del buffer[:]
+    return messages
+
+
+def encode_message(message, cache):
+    # status queries and repeated commands are encoded only once
+    frame = cache.get(message)
+    if frame is None:
+        frame = message.encode('ascii') + TERMINATOR
+        if len(cache) < FRAME_CACHE:
+            cache[message] = frame
+    return frame
+
+
+def set_keepalive(handle):
+    # enable TCP keepalive on a socket with short timings where the platform allows them to be tuned
+    handle.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    options = (('TCP_KEEPIDLE', KEEPALIVE_IDLE), ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL), ('TCP_KEEPCNT', KEEPALIVE_COUNT))
+    for name, value in options:
+        if hasattr(socket, name):
+            try:
+                handle.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+            except (socket.error, AttributeError) as e:
+                logger.debug('Unable to set {}: {}'.format(name, e))
+
+
+class PendingCommand(object):
+    """
+    A command awaiting its response.
+
+    :param message: formatted command
+    :param result: Deferred or Future completed with the response
+    """
+    __slots__ = ('name', 'message', 'result', 'sent', 'timeout')
+
+    def __init__(self, message, result):
+        self.message = message
+        self.name = message.split('(', 1)[0].strip()
+        self.result = result
+        self.sent = time.time()
+        self.timeout = None
+
+
+def cancel_timer(timer):
+    # reactor calls can only be cancelled while active, asyncio handles at any time
+    if getattr(timer, 'active', lambda: True)():
+        timer.cancel()
+
+
+class CommandTracker(object):
+    """
+    Correlation of responses with in-flight commands, shared by the Twisted and asyncio links.
+    Responses are matched to commands, round-trip times are kept per command type and commands
+    without a response expire. Completing the Deferred or Future of a command is left to the link.
+
+    :param call_later: callable(delay, func, *args) scheduling a call, returns a cancellable timer
+    :param resolve: callable(command, response) completing a command
+    :param reject: callable(command, exception) failing a command
+    """
+
+    def __init__(self, call_later, resolve, reject):
+        self.call_later = call_later
+        self.resolve = resolve
+        self.reject = reject
+        self.pending = deque()
+        self.latency = {}
+
+    def track(self, command):
+        """
+        Start waiting for the response to a command which is about to be sent.
+
+        :param command: PendingCommand
+        """
+        command.timeout = self.call_later(COMMAND_TIMEOUTS.get(command.name, COMMAND_TIMEOUT), self.expire, command)
+        self.pending.append(command)
+
+    def match(self, message):
+        """
+        Remove and return the in-flight command a response belongs to. Responses normally echo the
+        command name, otherwise the oldest in-flight command is assumed.
+        """
+        for command in self.pending:
+            if message.startswith(command.name):
+                break
+        else:
+            command = self.pending[0]
+        self.pending.remove(command)
+        return command
+
+    def complete(self, message):
+        command = self.match(message)
+        cancel_timer(command.timeout)
+        stats = self.latency.setdefault(command.name, CommandStats())
+        stats.add(time.time() - command.sent)
+        self.resolve(command, message)
+
+    def expire(self, command):
+        if command in self.pending:
+            self.pending.remove(command)
+            self.latency.setdefault(command.name, CommandStats()).timeouts += 1
+            self.reject(command, CommandTimeout('No response to: {}'.format(command.message)))
+
+    def fail_all(self, reason):
+        while self.pending:
+            command = self.pending.popleft()
+            cancel_timer(command.timeout)
+            self.reject(command, reason)
+
+
+class CommandProtocol(protocol.Protocol):
+    """
+    Framing of the CATS wire format. Received data is collected in a reusable buffer and scanned for
+    complete frames, which may arrive split over or merged within reads. Outgoing messages are
+    written with a single terminator in one write.
+    """
     protocol_name = 'CATS Command Link'
     message_type = MessageType.RESPONSE
 
     def __init__(self, factory):
         self.factory = factory
+        self.buffer = bytearray()
+        self.frames = {}
 
     def connectionMade(self):
         reactor.addSystemEventTrigger('before', 'shutdown', self.transport.abortConnection)
+        get_handle = getattr(self.transport, 'getHandle', None)
+        if get_handle is not None:
+            # only TCP transports have a socket, not the in-memory ones used by the benchmarks
+            set_keepalive(get_handle())
         logger.warn('{} Connected!'.format(self.protocol_name))
 
     def connectionLost(self, reason=protocol.connectionDone):
         logger.warning('{} Disconnected: {}'.format(self.protocol_name, reason.getErrorMessage()))
 
-    def lineReceived(self, line):
-        self.receive_message(line.strip())
+    def dataReceived(self, data):
+        self.buffer.extend(data)
+        for message in split_frames(self.buffer):
+            self.receive_message(message)
 
     def send_message(self, message):
         if self.transport:
-            self.sendLine('{}\r\n'.format(message))
+            self.transport.write(encode_message(message, self.frames))
 
     def receive_message(self, message):
         self.factory.receive_message(message, self.message_type)
@@ -43,15 +264,28 @@ class StatusProtocol(CommandProtocol):
 
 class CommandFactory(protocol.ReconnectingClientFactory):
     protocol = CommandProtocol
+    message_type = MessageType.RESPONSE
 
-    def __init__(self, application):
+    def __init__(self, application, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY, jitter=BACKOFF_JITTER):
         self.application = application
+        self.initialDelay = self.delay = initial_delay
+        self.maxDelay = max_delay
+        self.factor = BACKOFF_FACTOR
+        self.jitter = jitter
         self.ready = False
         self.client = None
+        self.commands = CommandTracker(reactor.callLater, self.resolve_command, self.reject_command)
+        self.pending = self.commands.pending
+        self.latency = self.commands.latency
+        self.received = 0
+        self.sent = 0
+        self.connections = 0
+        self.last_received = 0.0
 
     def buildProtocol(self, address):
         logger.log(log.IMPORTANT, '{} Ready: {}'.format(address, self.protocol.protocol_name))
         self.client = self.protocol(self)
+        self.connections += 1
         self.resetDelay()
         self.ready = True
         self.application.connect(self.protocol.message_type)
@@ -67,19 +301,57 @@ class CommandFactory(protocol.ReconnectingClientFactory):
         self.on_disconnect()
         protocol.ReconnectingClientFactory.clientConnectionFailed(self, connector, reason)
 
+    def drop(self):
+        """
+        Abort the connection so that it is re-established with the initial reconnection delay.
+        """
+        self.resetDelay()
+        if self.client and self.client.transport:
+            self.client.transport.abortConnection()
+
     def send_message(self, message):
         if self.ready and self.client:
+            self.sent += 1
             self.client.send_message(message)
         else:
             logger.error('Client not connected. Command ignored!')
 
+    def send_command(self, message):
+        """
+        Send a command and track its response.
+
+        :param message: formatted command
+        :return: Deferred which fires with the response, or fails with CommandTimeout if no response
+            arrives within the timeout for the command type
+        """
+        if not (self.ready and self.client):
+            return defer.fail(error.NotConnectingError('Client not connected. Command ignored!'))
+        command = PendingCommand(message, defer.Deferred())
+        self.commands.track(command)
+        self.send_message(message)
+        return command.result
+
+    @staticmethod
+    def resolve_command(command, message):
+        command.result.callback(message)
+
+    @staticmethod
+    def reject_command(command, reason):
+        command.result.errback(reason)
+
     def receive_message(self, message, message_type):
+        self.received += 1
+        self.last_received = time.time()
+        if message_type == MessageType.RESPONSE and self.pending:
+            self.commands.complete(message)
         self.application.receive_message(message, message_type)
 
     def on_disconnect(self):
+        self.commands.fail_all(error.ConnectionLost('Command link lost'))
         self.application.disconnect(self.protocol.message_type)
 
 
 class StatusFactory(CommandFactory):
     protocol = StatusProtocol
+    message_type = MessageType.STATUS
 
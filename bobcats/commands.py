@@ -0,0 +1,242 @@
+import numbers
+from collections import namedtuple
+from enum import Enum
+
+from .inventory import NUM_LIDS, NUM_PLATES, NUM_PUCK_SAMPLES, NUM_WELLS, PUCK_NAMES, PORT_ARGS, ToolType
+
+NUM_SAMPLES = NUM_PUCK_SAMPLES * len(PUCK_NAMES)   # samples per lid
+
+
+# FIXME: I don't know what types of plates are supported by CATS
+class PlateType(Enum):
+    TYPE1, TYPE2, TYPE3 = range(3)
+
+
+class CommandError(ValueError):
+    pass
+
+
+# Position of each named argument in the argument list of the CATS trajectory commands
+ARGUMENT_SLOTS = {
+    'tool': 0, 'lid': 1, 'sample': 2, 'plate': 5, 'well': 6, 'plate_type': 7, 'drop': 8, 'x': 10, 'y': 11,
+    'z': 12, 'angle': 13, 'delta': 14, 'exposure': 15, 'steps': 16, 'end_angle': 17,
+}
+
+# Number of arguments and required named arguments of each trajectory command
+COMMAND_LAYOUTS = {
+    'put': (13, ('tool', 'lid', 'sample')),
+    'getput': (13, ('tool', 'lid', 'sample')),
+    'putplate': (8, ('tool', 'plate', 'well', 'plate_type')),
+    'getputplate': (9, ('tool', 'plate', 'well', 'plate_type', 'drop')),
+    'adjust': (12, ('tool', 'x', 'y')),
+    'focus': (13, ('tool', 'z')),
+    'plateangle': (14, ('tool', 'angle')),
+    'expose': (17, ('tool', 'angle', 'delta', 'exposure', 'steps')),
+    'collect': (18, ('tool', 'angle', 'delta', 'exposure', 'steps', 'end_angle')),
+}
+
+# Batch results, commands has one entry per item, None for invalid items, errors maps item index to message
+Batch = namedtuple('Batch', 'commands errors')
+
+
+def format_command(command, *args):
+    # formats ('put', 2, 1, 21) as 'put(2,1,21)'
+    if args:
+        return '{}({})'.format(command, ','.join([str(arg) for arg in args]))
+    else:
+        return command
+
+
+def build_command(command, **kwargs):
+    """
+    Format a trajectory command from named arguments, unspecified arguments are zero.
+
+    :param command: command name, one of COMMAND_LAYOUTS
+    :param kwargs: named arguments, see ARGUMENT_SLOTS
+    :return: formatted command, e.g. 'put(2,1,21,0,0,0,0,0,0,0,0,0,0)'
+    """
+    length, required = COMMAND_LAYOUTS[command]
+    missing = [name for name in required if kwargs.get(name) is None]
+    if missing:
+        raise CommandError('{}: missing {}'.format(command, ', '.join(missing)))
+    args = [0] * length
+    for name, value in kwargs.items():
+        if value is not None:
+            args[ARGUMENT_SLOTS[name]] = value
+    return format_command(command, *args)
+
+
+def check_value(name, value, kind=numbers.Real):
+    # required numeric argument, booleans are not numbers here
+    if value is None:
+        raise CommandError('Missing {}'.format(name))
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise CommandError('Invalid {}: {!r}'.format(name, value)[:40])
+
+
+def check_range(name, value, low, high):
+    check_value(name, value, numbers.Integral)
+    if not (low <= value <= high):
+        raise CommandError('Invalid {}: {}'.format(name, value))
+
+
+def check_tool(tool, expected):
+    check_value('tool', tool, numbers.Integral)
+    if tool != expected.value:
+        raise CommandError('Tool must be {}'.format(expected.name))
+
+
+def puck_command(command, tool, lid, sample):
+    """
+    put or getput of a puck sample.
+    """
+    check_tool(tool, ToolType.PUCK)
+    check_range('lid', lid, 1, NUM_LIDS)
+    check_range('sample', sample, 1, NUM_SAMPLES)
+    return build_command(command, tool=tool, lid=lid, sample=sample)
+
+
+def plate_command(command, tool, plate, well, plate_type, drop=None):
+    """
+    putplate or getputplate of a plate well.
+    """
+    check_tool(tool, ToolType.PLATE)
+    check_range('plate', plate, 1, NUM_PLATES)
+    check_range('well', well, 1, NUM_WELLS)
+    check_range('plate type', plate_type, 0, len(PlateType) - 1)
+    if drop is not None:
+        check_range('drop', drop, 0, NUM_PLATES)
+    return build_command(command, tool=tool, plate=plate, well=well, plate_type=plate_type, drop=drop)
+
+
+def adjust_command(tool, x, y):
+    check_tool(tool, ToolType.PLATE)
+    check_value('x', x)
+    check_value('y', y)
+    return build_command('adjust', tool=tool, x=x, y=y)
+
+
+def focus_command(tool, z):
+    check_tool(tool, ToolType.PLATE)
+    check_value('z', z)
+    return build_command('focus', tool=tool, z=z)
+
+
+def tilt_command(tool, angle):
+    check_tool(tool, ToolType.PLATE)
+    check_value('angle', angle)
+    return build_command('plateangle', tool=tool, angle=angle)
+
+
+def exposure_command(command, tool, start, delta, exposure, steps, end_angle=None):
+    """
+    expose, or collect if end_angle is given.
+    """
+    check_tool(tool, ToolType.PLATE)
+    check_value('start', start)
+    check_value('delta', delta)
+    check_value('exposure', exposure)
+    check_value('steps', steps, numbers.Integral)
+    if end_angle is not None:
+        check_value('end angle', end_angle)
+    if exposure <= 0:
+        raise CommandError('Invalid exposure: {}'.format(exposure))
+    if steps < 1:
+        raise CommandError('Invalid steps: {}'.format(steps))
+    return build_command(
+        command, tool=tool, angle=start, delta=delta, exposure=exposure, steps=steps, end_angle=end_angle
+    )
+
+
+def port_args(port):
+    # only canonical names are accepted, 'L1A11' would otherwise be parsed as L1B1
+    try:
+        params = PORT_ARGS.get(port)
+    except TypeError:
+        params = None
+    if not params:
+        raise CommandError('Invalid port: {!r}'.format(port)[:40])
+    return params
+
+
+def mount_command(port, occupied='', plate_type=0):
+    """
+    Command mounting a port, put or putplate if nothing is in place yet, getput or getputplate otherwise.
+
+    :param port: canonical port name such as 'L1A1' or 'P1A1'
+    :param occupied: port of the sample currently mounted, or of the plate on the tool
+    :param plate_type: plate type for plate ports
+    """
+    params = port_args(port)
+    if params['mode'] == 'puck':
+        command = 'getput' if occupied else 'put'
+        return puck_command(command, params['tool'], params['lid'], params['sample'])
+    else:
+        if occupied:
+            return plate_command('getputplate', params['tool'], params['plate'], params['well'], plate_type, 0)
+        return plate_command('putplate', params['tool'], params['plate'], params['well'], plate_type)
+
+
+def run_batch(items, func):
+    commands = []
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            commands.append(func(item))
+        except CommandError as e:
+            commands.append(None)
+            errors[index] = str(e)
+    return Batch(commands, errors)
+
+
+def prepare_mounts(ports, mounted='', tooled='', plate_type=0):
+    """
+    Validate a list of ports and build the commands mounting them one after the other.
+
+    :param ports: port names
+    :param mounted: sample mounted before the first port, '' if none
+    :param tooled: plate on the tool before the first port, '' if none
+    :param plate_type: plate type for plate ports
+    :return: Batch of commands and errors
+    """
+    state = {'puck': mounted, 'plate': tooled}
+
+    def build(port):
+        mode = port_args(port)['mode']
+        command = mount_command(port, state[mode], plate_type)
+        state[mode] = port
+        return command
+    return run_batch(ports, build)
+
+
+def prepare_plates(targets, tool=ToolType.PLATE.value):
+    """
+    Validate plate targets and build their putplate or getputplate commands.
+
+    :param targets: dictionaries with plate, well and plate_type keys, and drop for getputplate
+    :param tool: tool number
+    :return: Batch of commands and errors
+    """
+    def build(target):
+        command = 'getputplate' if target.get('drop') is not None else 'putplate'
+        return plate_command(
+            command, tool, target.get('plate'), target.get('well'), target.get('plate_type'), target.get('drop')
+        )
+    return run_batch(targets, build)
+
+
+def prepare_exposures(exposures, tool=ToolType.PLATE.value):
+    """
+    Validate exposure parameters and build their expose or collect commands.
+
+    :param exposures: dictionaries with start, delta, exposure and steps keys, and end_angle for collect
+    :param tool: tool number
+    :return: Batch of commands and errors
+    """
+    def build(params):
+        command = 'collect' if params.get('end_angle') is not None else 'expose'
+        return exposure_command(
+            command, tool, params.get('start'), params.get('delta'), params.get('exposure'), params.get('steps'),
+            params.get('end_angle')
+        )
+    return run_batch(exposures, build)
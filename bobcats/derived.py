@@ -0,0 +1,93 @@
+from enum import Enum
+
+from .inventory import pin2port, plate2port
+
+
+class StatusType(Enum):
+    IDLE, WAITING, BUSY, ERROR = range(4)
+
+
+def mounted_port(state):
+    # port of the sample on the diffractometer
+    return pin2port(state.get('lid_diff_fbk', 0), state.get('sample_diff_fbk', 0))
+
+
+def tooled_port(state):
+    # port of the sample or plate on the tool
+    return (
+        pin2port(state.get('lid_tool_fbk', 0), state.get('sample_tool_fbk', 0)) or
+        plate2port(state.get('plate_fbk', 0), state.get('well_fbk', 0))
+    )
+
+
+def robot_status(state):
+    if state.get('mode_fbk') == 1 and state.get('default_fbk') == 1:
+        if state.get('running_fbk'):
+            return StatusType.BUSY.value
+        else:
+            return StatusType.IDLE.value
+    else:
+        return StatusType.ERROR.value
+
+
+class Rule(object):
+    """
+    A value derived from state fields.
+
+    :param name: BobCATS attribute the value is published to
+    :param inputs: names of the state fields the value depends on
+    :param func: callable computing the value from a StatusSnapshot
+    """
+
+    def __init__(self, name, inputs, func):
+        self.name = name
+        self.inputs = frozenset(inputs)
+        self.func = func
+
+
+# Derived values, evaluated in this order
+RULES = (
+    Rule('mounted_fbk', ('lid_diff_fbk', 'sample_diff_fbk'), mounted_port),
+    Rule('tooled_fbk', ('lid_tool_fbk', 'sample_tool_fbk', 'plate_fbk', 'well_fbk'), tooled_port),
+    Rule('status', ('mode_fbk', 'default_fbk', 'running_fbk'), robot_status),
+)
+
+
+class DerivedState(object):
+    """
+    Recomputes derived values once per state update, and only those with a changed input. Values are
+    published through the change-suppressing StatusDecoder.
+
+    :param ioc: BobCATS model instance
+    :param decoder: StatusDecoder used to publish the values
+    :param rules: sequence of Rule instances
+    """
+
+    def __init__(self, ioc, decoder, rules=RULES):
+        self.decoder = decoder
+        self.rules = tuple((rule, getattr(ioc, rule.name)) for rule in rules)
+        self.values = {}
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def reset(self):
+        self.values.clear()
+
+    def update(self, state, changed):
+        """
+        Recompute the values depending on changed fields.
+
+        :param state: StatusSnapshot of the state fields
+        :param changed: set of names of the fields changed by the last state reply
+        :return: set of names of the derived values which changed
+        """
+        updated = set()
+        for rule, variable in self.rules:
+            if rule.name in self.values and not rule.inputs & changed:
+                continue
+            value = rule.func(state)
+            self.values[rule.name] = value
+            if self.decoder.publish(('derived', rule.name), variable, value):
+                updated.add(rule.name)
+        return updated
@@ -0,0 +1,157 @@
+import re
+import time
+from collections import deque, namedtuple
+
+try:
+    from ConfigParser import ConfigParser
+except ImportError:
+    from configparser import ConfigParser
+
+from softdev import models
+
+NUM_BITS = 40           # bits of the di and do replies without a bit map
+EVENT_HISTORY = 256     # number of recent bit changes kept
+
+# One bit of a di or do reply, position is the index of the bit within the comma separated reply
+IOBit = namedtuple('IOBit', 'position name desc')
+
+# PV prefix of each I/O reply
+CONTEXTS = (('di', 'DI'), ('do', 'DO'))
+
+BIT_NAME = re.compile(r'^[A-Za-z]\w*$')
+
+
+def default_bit_map(size=NUM_BITS):
+    # generic names for all bits of both words
+    return {
+        'di': tuple(IOBit(i, 'in{:02d}'.format(i), 'Digital Input {}'.format(i)) for i in range(size)),
+        'do': tuple(IOBit(i, 'out{:02d}'.format(i), 'Digital Output {}'.format(i)) for i in range(size)),
+    }
+
+
+def load_bit_map(filename):
+    """
+    Load the names and meanings of the I/O bits from an INI file with di and do sections, for example::
+
+        [di]
+        0 = estop, Emergency Stop
+        5 = lid1_open, Dewar Lid 1 Open
+
+        [do]
+        2 = gripper, Gripper Closed
+
+    Only the listed bits get a PV.
+
+    :param filename: bit map file
+    :return: dictionary mapping di and do to tuples of IOBit
+    """
+    parser = ConfigParser()
+    if not parser.read(filename):
+        raise IOError('Unable to read I/O bit map: {}'.format(filename))
+    bit_map = {}
+    for context, prefix in CONTEXTS:
+        bits = []
+        if parser.has_section(context):
+            for position, text in parser.items(context):
+                name, _, desc = [part.strip() for part in text.partition(',')]
+                if not (position.isdigit() and BIT_NAME.match(name)):
+                    raise ValueError('Invalid {} bit: {} = {}'.format(context, position, text))
+                bits.append(IOBit(int(position), name, desc or name))
+        bit_map[context] = tuple(sorted(bits))
+    return bit_map
+
+
+def build_model(bit_map):
+    """
+    Create a model class with one binary PV per mapped bit, named DI:<name> and DO:<name>.
+
+    :param bit_map: dictionary mapping di and do to tuples of IOBit
+    :return: models.Model subclass
+    """
+    fields = {
+        'io_event': models.String('IO:event', max_length=40, desc='Last I/O Change'),
+        'io_event_time': models.Float('IO:eventTime', units='sec', desc='Last I/O Change Time'),
+    }
+    for context, prefix in CONTEXTS:
+        for bit in bit_map.get(context, ()):
+            fields['{}_{}'.format(context, bit.name)] = models.BinaryInput(
+                '{}:{}'.format(prefix, bit.name), desc=bit.desc[:40]
+            )
+    return type('BobCATSIO', (models.Model,), fields)
+
+
+class BitDecoder(object):
+    """
+    Finds the mapped bits which changed between consecutive replies of one I/O word.
+
+    :param bits: sequence of IOBit
+    """
+
+    def __init__(self, bits):
+        self.bits = {bit.position: bit for bit in bits}
+        self.mask = sum(1 << position for position in self.bits)
+        self.word = None
+
+    def update(self, text):
+        """
+        Decode a reply and compare it to the previous one, all mapped bits are reported for the first reply.
+
+        :param text: reply fields such as '0,1,1'
+        :return: list of (IOBit, value) tuples for the changed bits
+        """
+        word = int(text.replace(',', '')[::-1], 2)  # bit n is the n-th field
+        changed = self.mask if self.word is None else (word ^ self.word) & self.mask
+        self.word = word
+        changes = []
+        while changed:
+            low = changed & -changed
+            position = low.bit_length() - 1
+            changes.append((self.bits[position], int(bool(word & low))))
+            changed ^= low
+        return changes
+
+
+class DigitalIO(object):
+    """
+    Publishes every change of a mapped di or do bit to its own PV. Recent changes are also kept as
+    (timestamp, PV name, value) events, the initial values from the first reply are not events.
+
+    :param bit_map: dictionary mapping di and do to tuples of IOBit, all bits with generic names if not given
+    """
+
+    def __init__(self, bit_map=None):
+        self.bit_map = bit_map or default_bit_map()
+        self.decoders = {context: BitDecoder(self.bit_map.get(context, ())) for context, prefix in CONTEXTS}
+        self.prefixes = dict(CONTEXTS)
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.model = None
+
+    def build(self, device_name):
+        self.model = build_model(self.bit_map)(device_name)
+
+    def update(self, context, text, timestamp=None):
+        """
+        Publish the changed bits of a di or do reply.
+
+        :param context: 'di' or 'do'
+        :param text: reply fields
+        :param timestamp: time of the reply, now if not given
+        :return: list of (IOBit, value) tuples for the changed bits
+        """
+        decoder = self.decoders[context]
+        initial = decoder.word is None
+        changes = decoder.update(text)
+        now = time.time() if timestamp is None else timestamp
+        for bit, value in changes:
+            getattr(self.model, '{}_{}'.format(context, bit.name)).put(value)
+            if initial:
+                continue
+            name = '{}:{}'.format(self.prefixes[context], bit.name)
+            self.events.append((now, name, value))
+            self.model.io_event.put('{}={}'.format(name, value)[:40])
+            self.model.io_event_time.put(now)
+        return changes
+
+    def shutdown(self):
+        if self.model is not None:
+            self.model.shutdown()
@@ -0,0 +1,192 @@
+import re
+from collections import deque
+from enum import Enum
+
+from softdev import log
+
+from .derived import mounted_port
+from .inventory import PORT_ARGS, PORT_INDEX
+
+logger = log.get_module_logger(__name__)
+
+# steps of a sample exchange, timed individually
+STEPS = ('wait', 'start', 'transfer', 'collect')
+
+# commands issued for an exchange
+MOUNT_COMMANDS = ('put', 'getput', 'putplate', 'getputplate')
+MOUNT_TIMEOUT = 180.0   # seconds from the command until the mount must have completed
+
+
+class ExchangeState(Enum):
+    IDLE, READY, MOUNTING, COLLECTING = range(4)
+
+
+def parse_ports(text):
+    # converts 'L1A1, L1A2 L1B3' to ['L1A1', 'L1A2', 'L1B3']
+    return [port for port in re.split(r'[\s,;]+', text.strip()) if port]
+
+
+class MountQueue(object):
+    """
+    Ordered list of ports mounted one after the other without operator intervention. The next
+    exchange is issued as soon as the beamline releases the current sample and the robot is idle.
+
+    Each exchange is timed in steps: waiting for the robot after the release, waiting for the path
+    to start after the command was issued, the transfer itself and the collection until the release.
+
+    :param app: BobCATSApp instance
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.ports = deque()
+        self.state = ExchangeState.IDLE
+        self.port = ''
+        self.started = False
+        self.times = {}
+        self.exchanges = 0
+        self.run_start = 0
+
+    def validate(self, text):
+        """
+        Check a list of ports without loading it.
+
+        :param text: ports separated by commas or spaces
+        :return: list of invalid ports, empty if the list can be loaded
+        """
+        return [port for port in parse_ports(text) if port not in PORT_ARGS]
+
+    def load(self, text):
+        """
+        Validate and load a list of ports. The list is rejected as a whole if any port is invalid.
+
+        :param text: ports separated by commas or spaces
+        :return: list of invalid ports, empty if the list was loaded
+        """
+        invalid = self.validate(text)
+        if invalid:
+            return invalid
+        ports = parse_ports(text)
+        self.ports = deque(ports)
+        self.publish()
+        return []
+
+    def start(self):
+        if self.state == ExchangeState.IDLE and self.ports:
+            self.state = ExchangeState.READY
+            self.exchanges = 0
+            self.run_start = self.app.clock()
+            self.times = {'released': self.app.clock()}
+            self.step()
+        self.publish()
+
+    def stop(self):
+        if self.state != ExchangeState.IDLE:
+            logger.warning('Mount queue stopped with {} ports remaining'.format(len(self.ports)))
+        self.state = ExchangeState.IDLE
+        self.port = ''
+        self.publish()
+
+    def release(self):
+        """
+        The beamline is done with the mounted sample, proceed with the next exchange.
+        """
+        if self.state == ExchangeState.COLLECTING:
+            now = self.app.clock()
+            self.record('collect', now - self.times.get('mounted', now))
+            self.times = {'released': now}
+            if self.ports:
+                self.state = ExchangeState.READY
+            else:
+                self.state = ExchangeState.IDLE
+                self.port = ''
+                logger.info('Mount queue completed, {} samples'.format(self.exchanges))
+            self.step()
+            self.publish()
+
+    def step(self):
+        # issue the next exchange if the robot is idle
+        if self.state != ExchangeState.READY:
+            return
+        state = self.app.parser.snapshot
+        if state.get('running_fbk') or not self.app.ready_for_commands():
+            return
+        port = self.ports.popleft()
+        if self.app.mount_port(port):
+            now = self.app.clock()
+            self.record('wait', now - self.times.get('released', now))
+            self.times['issued'] = now
+            self.port = port
+            self.started = False
+            self.state = ExchangeState.MOUNTING
+            self.publish()
+        else:
+            self.ports.appendleft(port)
+
+    def fail(self, reason):
+        message = 'Mount of {} failed: {}'.format(self.port, reason)
+        logger.error(message)
+        self.app.ioc.warning.put(message[:40])
+        self.stop()
+
+    def command_failed(self, command, reason):
+        """
+        The controller rejected or did not answer a command.
+
+        :param command: command text
+        :param reason: error reply or failure message
+        """
+        name = command.split('(', 1)[0].strip()
+        if self.state == ExchangeState.MOUNTING and not self.started and name in MOUNT_COMMANDS:
+            self.fail(reason)
+
+    def check(self):
+        # called for every state reply: retry an exchange which could not be issued yet, since an idle
+        # robot sends no state changes, and give up on one which neither completes nor fails
+        if self.state == ExchangeState.READY:
+            self.step()
+        elif self.state == ExchangeState.MOUNTING and self.app.clock() - self.times['issued'] > MOUNT_TIMEOUT:
+            self.fail('timeout')
+
+    def update(self, state):
+        """
+        Follow the robot state during an exchange.
+
+        :param state: StatusSnapshot of the decoded state fields
+        """
+        if self.state == ExchangeState.READY:
+            self.step()
+        elif self.state == ExchangeState.MOUNTING:
+            now = self.app.clock()
+            running = state.get('running_fbk')
+            mounted = mounted_port(state)
+            if running and not self.started:
+                self.started = True
+                self.times['running'] = now
+                self.record('start', now - self.times['issued'])
+            elif not running and (self.started or mounted == self.port):
+                if not self.started:
+                    # the whole path ran between two state replies
+                    self.times['running'] = self.times['issued']
+                if self.port in PORT_INDEX and mounted != self.port:
+                    self.fail('not mounted')
+                    return
+                self.record('transfer', now - self.times['running'])
+                self.times['mounted'] = now
+                self.exchanges += 1
+                self.state = ExchangeState.COLLECTING
+                self.publish()
+
+    def record(self, step, duration):
+        variable = getattr(self.app.ioc, 'exchange_{}'.format(step))
+        variable.put(duration)
+
+    def publish(self):
+        ioc = self.app.ioc
+        ioc.queue_state.put(self.state.value)
+        ioc.queue_remaining.put(len(self.ports))
+        ioc.queue_current.put(self.port)
+        ioc.exchange_count.put(self.exchanges)
+        elapsed = self.app.clock() - self.run_start
+        if self.exchanges and elapsed > 0:
+            ioc.exchange_rate.put(self.exchanges * 3600.0 / elapsed)
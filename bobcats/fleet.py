@@ -0,0 +1,114 @@
+import os
+import resource
+import threading
+
+try:
+    from ConfigParser import ConfigParser
+except ImportError:
+    from configparser import ConfigParser
+
+from softdev import log
+from twisted.internet import task
+from . import ioc, cats
+
+logger = log.get_module_logger(__name__)
+
+REPORT_TIME = 300.0     # seconds between resource usage reports
+
+
+def load_config(filename):
+    """
+    Load robot definitions from an INI file with one section per device, for example::
+
+        [CATS1608-000]
+        address = cats1.example.com
+        commands = 1000
+        status = 10000
+        link_timeout = 3.0
+        max_delay = 10.0
+        io_map = /etc/bobcats/cats1-io.ini
+
+    The link_timeout, max_delay and io_map options are optional.
+
+    :param filename: configuration file
+    :return: list of dictionaries with device, address, commands, status, link_timeout, max_delay and io_map keys
+    """
+    parser = ConfigParser()
+    if not parser.read(filename):
+        raise IOError('Unable to read configuration: {}'.format(filename))
+    robots = []
+    for section in parser.sections():
+        robots.append({
+            'device': section,
+            'address': parser.get(section, 'address'),
+            'commands': parser.getint(section, 'commands') if parser.has_option(section, 'commands') else 1000,
+            'status': parser.getint(section, 'status') if parser.has_option(section, 'status') else 10000,
+            'link_timeout': (
+                parser.getfloat(section, 'link_timeout') if parser.has_option(section, 'link_timeout')
+                else cats.LINK_TIMEOUT
+            ),
+            'max_delay': (
+                parser.getfloat(section, 'max_delay') if parser.has_option(section, 'max_delay') else cats.MAX_DELAY
+            ),
+            'io_map': parser.get(section, 'io_map') if parser.has_option(section, 'io_map') else None,
+        })
+    return robots
+
+
+def memory_usage():
+    """
+    Resident memory of this process in kB.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (IOError, OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Fleet(object):
+    """
+    Runs several BobCATSApp instances on the shared reactor. Status polling of each robot is
+    offset by a fraction of the polling tick so that robots do not poll in lockstep.
+
+    :param robots: list of robot definitions as returned by load_config
+    :param backend: controller link implementation, 'twisted' or 'asyncio'
+    """
+
+    def __init__(self, robots, backend='twisted'):
+        self.apps = []
+        self.usage = {}
+        for i, robot in enumerate(robots):
+            memory, threads = memory_usage(), threading.active_count()
+            app = ioc.BobCATSApp(
+                robot['device'], robot['address'], robot['commands'], robot['status'],
+                poll_offset=i * ioc.STATUS_TIME / len(robots), link_timeout=robot['link_timeout'],
+                max_delay=robot['max_delay'], backend=backend, io_map=robot.get('io_map')
+            )
+            app.build()     # create the PVs now rather than deferred, so that they are part of the usage figures
+            self.usage[robot['device']] = {
+                'memory': memory_usage() - memory,
+                'threads': threading.active_count() - threads,
+            }
+            self.apps.append(app)
+        self.reporter = task.LoopingCall(self.report)
+        self.reporter.start(REPORT_TIME, now=False)
+
+    def report(self):
+        logger.info('{} robots, {} kB resident, {} threads'.format(
+            len(self.apps), memory_usage(), threading.active_count()
+        ))
+        for app in self.apps:
+            usage = self.usage[app.device_name]
+            logger.info(
+                '{}: startup {} kB, {} threads; connected={}, queued={}, in-flight={}, published={}'.format(
+                    app.device_name, usage['memory'], usage['threads'], int(app.ready), len(app.outbox),
+                    len(app.command_client.pending), app.decoder.published
+                )
+            )
+
+    def shutdown(self):
+        if self.reporter.running:
+            self.reporter.stop()
+        for app in self.apps:
+            app.shutdown()
@@ -0,0 +1,154 @@
+import bisect
+import time
+from array import array
+
+HISTORY_LENGTH = 1024   # changes kept for each field
+
+# Recorded fields and the suffix of their HISTORY:* waveform PVs. All numeric status fields are
+# recorded. The path, barcode and message texts and the puck detection bitmaps are not, since the
+# waveforms only hold numbers and the pucks are followed by the inventory.
+HISTORY_FIELDS = (
+    ('power_fbk', 'power'), ('mode_fbk', 'auto'), ('default_fbk', 'default'), ('running_fbk', 'running'),
+    ('speed_fbk', 'speed'), ('ln2_dew1_fbk', 'ln2Dew1'), ('ln2_dew2_fbk', 'ln2Dew2'), ('inputs_fbk', 'inputs'),
+    ('outputs_fbk', 'outputs'), ('pos_speed_fbk', 'posSpeed'), ('tool_fbk', 'tool'), ('lid_tool_fbk', 'toolLid'),
+    ('sample_tool_fbk', 'toolSmpl'), ('lid_diff_fbk', 'diffLid'), ('sample_diff_fbk', 'diffSmpl'),
+    ('plate_fbk', 'plate'), ('well_fbk', 'well'), ('pos_dew1_fbk', 'pos1'), ('pos_dew2_fbk', 'pos2'),
+    ('pos_x_fbk', 'posX'), ('pos_y_fbk', 'posY'), ('pos_z_fbk', 'posZ'), ('pos_rx_fbk', 'posRX'),
+    ('pos_ry_fbk', 'posRY'), ('pos_rz_fbk', 'posRZ'),
+)
+
+# Fields decoded from other replies than state, with their StatusDecoder keys
+CONTEXT_FIELDS = {
+    'di': (('inputs_fbk', 'di'),),
+    'do': (('outputs_fbk', 'do'),),
+    'position': (
+        ('pos_speed_fbk', 'speed'), ('pos_x_fbk', ('position', 0)), ('pos_y_fbk', ('position', 1)),
+        ('pos_z_fbk', ('position', 2)), ('pos_rx_fbk', ('position', 3)), ('pos_ry_fbk', ('position', 4)),
+        ('pos_rz_fbk', ('position', 5)),
+    ),
+}
+
+
+class RingBuffer(object):
+    """
+    Fixed size history of timestamped values in preallocated arrays, the oldest entries are
+    overwritten once it is full.
+
+    :param length: maximum number of entries
+    """
+
+    def __init__(self, length=HISTORY_LENGTH):
+        self.length = length
+        self.times = array('d', [0.0]) * length
+        self.values = array('d', [0.0]) * length
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.times[self.index] = timestamp
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+
+    def last(self):
+        # most recent (timestamp, value) or None if empty
+        if self.count:
+            return self.times[self.index - 1], self.values[self.index - 1]
+
+    def arrays(self):
+        """
+        Copy of the entries in chronological order.
+
+        :return: tuple of timestamp and value arrays
+        """
+        if self.count < self.length:
+            return self.times[:self.count], self.values[:self.count]
+        return (
+            self.times[self.index:] + self.times[:self.index], self.values[self.index:] + self.values[:self.index]
+        )
+
+    def window(self, start=None, end=None):
+        """
+        Entries within a time window, the entry in effect at the start of the window included.
+
+        :param start: earliest timestamp, None for the oldest entry
+        :param end: latest timestamp, None for the newest entry
+        :return: list of (timestamp, value) tuples
+        """
+        times, values = self.arrays()
+        first = 0 if start is None else max(0, bisect.bisect_right(times, start) - 1)
+        last = len(times) if end is None else bisect.bisect_right(times, end)
+        return list(zip(times[first:last], values[first:last]))
+
+
+class StatusHistory(object):
+    """
+    Changes of selected status fields, kept in one RingBuffer per field. Only changes are recorded,
+    so a field keeps its value from one entry to the next.
+
+    :param fields: sequence of (field name, PV suffix) tuples
+    :param length: maximum number of changes kept for each field
+    """
+
+    def __init__(self, fields=HISTORY_FIELDS, length=HISTORY_LENGTH):
+        self.fields = tuple(name for name, suffix in fields)
+        self.buffers = {name: RingBuffer(length) for name in self.fields}
+        self.dirty = set()
+
+    def clear(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
+        self.dirty.update(self.fields)
+
+    def record(self, name, value, timestamp=None):
+        buffer = self.buffers.get(name)
+        if buffer is None or value is None:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        last = buffer.last()
+        if last is None or last[1] != value:
+            buffer.append(timestamp, value)
+            self.dirty.add(name)
+
+    def record_state(self, snapshot, changed):
+        """
+        Record the changed fields of a state reply.
+
+        :param snapshot: StatusSnapshot of the state fields
+        :param changed: names of the fields changed by the reply
+        """
+        for name in changed:
+            if name in self.buffers:
+                self.record(name, snapshot[name], snapshot.timestamp)
+
+    def record_reply(self, context, decoder, timestamp=None):
+        # record the fields decoded from a di, do or position reply, unchanged values are skipped
+        for name, key in CONTEXT_FIELDS.get(context, ()):
+            self.record(name, decoder.values.get(key), timestamp)
+
+    def query(self, start=None, end=None, names=None):
+        """
+        Recorded changes within a time window.
+
+        :param start: earliest timestamp, None for the oldest entry
+        :param end: latest timestamp, None for the newest entry
+        :param names: field names, all recorded fields if not given
+        :return: dictionary mapping field names to lists of (timestamp, value) tuples
+        """
+        names = self.fields if names is None else names
+        return {name: self.buffers[name].window(start, end) for name in names if name in self.buffers}
+
+    def publish(self, ioc):
+        # update the waveform PVs of the fields changed since the last call
+        for name in self.dirty:
+            times, values = self.buffers[name].arrays()
+            getattr(ioc, 'history_{}'.format(name)).put(list(values))
+            getattr(ioc, 'history_{}_time'.format(name)).put(list(times))
+        self.dirty.clear()
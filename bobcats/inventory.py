@@ -0,0 +1,168 @@
+from enum import Enum
+
+from .status import zero_int
+
+NUM_PUCK_SAMPLES = 10
+NUM_PLATES = 8
+NUM_WELLS = 192
+NUM_ROW_WELLS = 24
+NUM_LIDS = 3
+PUCK_NAMES = 'ABC'
+ROW_NAMES = 'ABCDEFGH'
+NUM_PUCKS = NUM_LIDS * len(PUCK_NAMES)
+
+# index of the first puck reported in the puck detection bitmap of each dewar. The port table only
+# covers the single dewar of the supported robots, the pucks of other dewars have no ports.
+DEWAR_PUCKS = {1: 0}
+
+
+# FIXME: Are these correct?
+class ToolType(Enum):
+    NONE, LASER, PUCK, PLATE = range(4)
+
+
+class PortState(Enum):
+    EMPTY, PRESENT, MOUNTED, TOOLED = range(4)
+
+
+def _parse_port(port):
+    # converts 'L1C1' to lid=1, sample=21, tool=2 for SPINE puck where NUM_PUCK_SAMPLES = 10
+    # converts 'P2B1' to plate=2, well=24, tool=3 for Plates puck where NUM_ROW_WELLS = 24
+    if len(port) < 4: return {}
+    args = {}
+    if port.startswith('L'):
+        args = {
+            'tool': ToolType.PUCK.value,
+            'lid': zero_int(port[1]),
+            'sample' : PUCK_NAMES.index(port[2])*NUM_PUCK_SAMPLES + zero_int(port[3:]),
+            'mode': 'puck'
+        }
+    elif port.startswith('P'):
+        args = {
+            'tool': ToolType.PLATE.value,
+            'plate': zero_int(port[1]),
+            'well': ROW_NAMES.index(port[2])*NUM_ROW_WELLS + zero_int(port[3:]),
+            'mode': 'plate'
+        }
+    return args
+
+
+# Precomputed lookup tables between port names and (lid, sample) or (plate, well)
+PUCK_PORTS = tuple(
+    'L{}{}{}'.format(lid, puck, pin)
+    for lid in range(1, NUM_LIDS + 1) for puck in PUCK_NAMES for pin in range(1, NUM_PUCK_SAMPLES + 1)
+)
+PLATE_PORTS = tuple(
+    'P{}{}{}'.format(plate, row, col)
+    for plate in range(1, NUM_PLATES + 1) for row in ROW_NAMES for col in range(1, NUM_ROW_WELLS + 1)
+)
+PORT_ARGS = {port: _parse_port(port) for port in PUCK_PORTS + PLATE_PORTS}
+PIN_PORTS = {(PORT_ARGS[port]['lid'], PORT_ARGS[port]['sample']): port for port in PUCK_PORTS}
+WELL_PORTS = {(PORT_ARGS[port]['plate'], PORT_ARGS[port]['well']): port for port in PLATE_PORTS}
+PORT_INDEX = {port: i for i, port in enumerate(PUCK_PORTS)}
+
+
+def port2args(port):
+    # converts 'L1C1' to lid=1, sample=21, tool=2, non-canonical names such as 'L1C01' are parsed
+    # not used by the IOC, which only accepts canonical names, kept for code importing it from bobcats.ioc
+    args = PORT_ARGS.get(port)
+    return dict(args) if args else _parse_port(port)
+
+
+def pin2port(lid, sample):
+    # converts lid=1, sample=21 to 'L1C1'
+    return PIN_PORTS.get((lid, sample), '')
+
+
+def plate2port(plate, well):
+    # converts plate=1, well=21 to 'P1A21'
+    return WELL_PORTS.get((plate, well), '')
+
+
+class Inventory(object):
+    """
+    Occupancy of all puck ports, updated incrementally from the puck detection bitmaps and the
+    mounted and picked sample feedback.
+    """
+
+    def __init__(self):
+        self.pucks = [0] * NUM_PUCKS
+        self.ports = [PortState.EMPTY.value] * len(PUCK_PORTS)
+        self.bitmaps = {}
+        self.mounted = ''
+        self.tooled = ''
+
+    def port_state(self, port):
+        index = PORT_INDEX.get(port)
+        return PortState.EMPTY.value if index is None else self.ports[index]
+
+    def is_valid(self, port):
+        return port in PORT_ARGS
+
+    def is_present(self, port):
+        return self.port_state(port) == PortState.PRESENT.value
+
+    def _refresh_puck(self, puck):
+        # recompute the pin states of one puck
+        start = puck * NUM_PUCK_SAMPLES
+        for index in range(start, start + NUM_PUCK_SAMPLES):
+            port = PUCK_PORTS[index]
+            if port == self.mounted:
+                state = PortState.MOUNTED.value
+            elif port == self.tooled:
+                state = PortState.TOOLED.value
+            elif self.pucks[puck]:
+                state = PortState.PRESENT.value
+            else:
+                state = PortState.EMPTY.value
+            self.ports[index] = state
+
+    def update_pucks(self, dewar, bitmap):
+        """
+        Update puck presence from a dewar puck detection bitmap such as '110000000'.
+
+        :return: True if the inventory changed
+        """
+        previous = self.bitmaps.get(dewar, '')
+        if bitmap == previous:
+            return False
+        self.bitmaps[dewar] = bitmap
+        offset = DEWAR_PUCKS.get(dewar, NUM_PUCKS)
+        changed = False
+        for i, bit in enumerate(bitmap):
+            puck = offset + i
+            if puck >= NUM_PUCKS:
+                break
+            present = int(bit == '1')
+            if present != self.pucks[puck]:
+                self.pucks[puck] = present
+                self._refresh_puck(puck)
+                changed = True
+        return changed
+
+    def _move(self, attribute, port):
+        previous = getattr(self, attribute)
+        if port == previous:
+            return False
+        setattr(self, attribute, port)
+        for name in (previous, port):
+            index = PORT_INDEX.get(name)
+            if index is not None:
+                self._refresh_puck(index // NUM_PUCK_SAMPLES)
+        return True
+
+    def update_mounted(self, port):
+        """
+        Record the port of the sample on the diffractometer, '' if none.
+
+        :return: True if the inventory changed
+        """
+        return self._move('mounted', port)
+
+    def update_tooled(self, port):
+        """
+        Record the port of the sample on the tool, '' if none.
+
+        :return: True if the inventory changed
+        """
+        return self._move('tooled', port)
@@ -1,33 +1,26 @@
 import time
-import re
-from Queue import Queue
 from datetime import datetime
-from threading import Thread
-from enum import Enum
-from twisted.internet import reactor
-from softdev import epics, models, log
-from . import cats
+from twisted.internet import reactor, task, defer
+from softdev import models, log
+from . import cats, commands, dio, journal, metrics
+from .commands import PlateType, format_command
+from .status import StatusParser, StatusDecoder
+from .polling import PollScheduler
+from .queues import CommandQueue, MessageInbox, SAFETY
+from .derived import DerivedState, StatusType
+from .exchange import MountQueue, ExchangeState
+from .history import StatusHistory, HISTORY_LENGTH
+from .profiler import CycleProfiler, SAFETY_FLAGS
+from .inventory import NUM_PUCK_SAMPLES, NUM_PLATES, NUM_WELLS, NUM_PUCKS, PUCK_PORTS, PORT_ARGS, ToolType, Inventory
+# names defined here before they moved, still imported from bobcats.ioc by other code
+from .inventory import NUM_ROW_WELLS, port2args, pin2port, plate2port
+from .status import zero_int
 logger = log.get_module_logger(__name__)
 
-NUM_PUCK_SAMPLES = 10
-NUM_PLATES = 8
-NUM_WELLS = 192
-NUM_ROW_WELLS = 24
-STATUS_TIME = 0.1
-
-
-# FIXME: Are these correct?
-class ToolType(Enum):
-    NONE, LASER, PUCK, PLATE = range(4)
-
-
-# FIXME: I don't know what types of plates are supported by CATS
-class PlateType(Enum):
-    TYPE1, TYPE2, TYPE3 = range(3)
-
-
-class StatusType(Enum):
-    IDLE, WAITING, BUSY, ERROR = range(4)
+STATUS_TIME = 0.05
+STATS_TIME = 10.0
+METRICS_TIME = 5.0
+HISTORY_TIME = 1.0
 
 
 class BobCATS(models.Model):
@@ -65,33 +58,161 @@ class BobCATS(models.Model):
     pucks_dew2_fbk = models.BinaryInput('STATE:pucks2', desc='Puck Detection 2')
     pos_dew1_fbk = models.Integer('STATE:pos1', desc='Position Dewar 1')
     pos_dew2_fbk = models.Integer('STATE:pos2', desc='Position Dewar 2')
+    pos_x_fbk = models.Float('STATE:posX', units='mm', desc='Robot X Position')
+    pos_y_fbk = models.Float('STATE:posY', units='mm', desc='Robot Y Position')
+    pos_z_fbk = models.Float('STATE:posZ', units='mm', desc='Robot Z Position')
+    pos_rx_fbk = models.Float('STATE:posRX', units='deg', desc='Robot RX Position')
+    pos_ry_fbk = models.Float('STATE:posRY', units='deg', desc='Robot RY Position')
+    pos_rz_fbk = models.Float('STATE:posRZ', units='deg', desc='Robot RZ Position')
+    pos_speed_fbk = models.Float('STATE:posSpeed', units='mm/s', desc='Robot Speed')
 
     mounted_fbk = models.String('STATE:onDiff', max_length=40, desc='Mounted')
     tooled_fbk = models.String('STATE:onTool', max_length=40, desc='Picked')
+    message_fbk = models.String('STATE:message', max_length=256, desc='Controller Message')
+    config_fbk = models.String('STATE:config', max_length=256, desc='Controller Configuration')
+    ventil_fbk = models.String('STATE:ventil', max_length=256, desc='Ventilation Status')
+    sequence_fbk = models.Integer('STATE:sequence', desc='Status Snapshot Sequence')
+
+    # Inventory
+    inventory_ports = models.Array('INVENTORY:ports', type=int, length=len(PUCK_PORTS), desc='Port States')
+    inventory_pucks = models.Array('INVENTORY:pucks', type=int, length=NUM_PUCKS, desc='Puck Presence')
+
+    # History
+    history_power_fbk = models.Array('HISTORY:power', type=float, length=HISTORY_LENGTH, desc='Robot Power History')
+    history_power_fbk_time = models.Array('HISTORY:powerTime', type=float, length=HISTORY_LENGTH, desc='Robot Power Change Times')
+    history_mode_fbk = models.Array('HISTORY:auto', type=float, length=HISTORY_LENGTH, desc='Auto Mode History')
+    history_mode_fbk_time = models.Array('HISTORY:autoTime', type=float, length=HISTORY_LENGTH, desc='Auto Mode Change Times')
+    history_default_fbk = models.Array('HISTORY:default', type=float, length=HISTORY_LENGTH, desc='Default Status History')
+    history_default_fbk_time = models.Array('HISTORY:defaultTime', type=float, length=HISTORY_LENGTH, desc='Default Status Change Times')
+    history_running_fbk = models.Array('HISTORY:running', type=float, length=HISTORY_LENGTH, desc='Path Running History')
+    history_running_fbk_time = models.Array('HISTORY:runningTime', type=float, length=HISTORY_LENGTH, desc='Path Running Change Times')
+    history_speed_fbk = models.Array('HISTORY:speed', type=float, length=HISTORY_LENGTH, desc='Speed Ratio History')
+    history_speed_fbk_time = models.Array('HISTORY:speedTime', type=float, length=HISTORY_LENGTH, desc='Speed Ratio Change Times')
+    history_ln2_dew1_fbk = models.Array('HISTORY:ln2Dew1', type=float, length=HISTORY_LENGTH, desc='LN2 Dewar 1 History')
+    history_ln2_dew1_fbk_time = models.Array('HISTORY:ln2Dew1Time', type=float, length=HISTORY_LENGTH, desc='LN2 Dewar 1 Change Times')
+    history_ln2_dew2_fbk = models.Array('HISTORY:ln2Dew2', type=float, length=HISTORY_LENGTH, desc='LN2 Dewar 2 History')
+    history_ln2_dew2_fbk_time = models.Array('HISTORY:ln2Dew2Time', type=float, length=HISTORY_LENGTH, desc='LN2 Dewar 2 Change Times')
+    history_inputs_fbk = models.Array('HISTORY:inputs', type=float, length=HISTORY_LENGTH, desc='Digital Inputs History')
+    history_inputs_fbk_time = models.Array('HISTORY:inputsTime', type=float, length=HISTORY_LENGTH, desc='Digital Inputs Change Times')
+    history_outputs_fbk = models.Array('HISTORY:outputs', type=float, length=HISTORY_LENGTH, desc='Digital Outputs History')
+    history_outputs_fbk_time = models.Array('HISTORY:outputsTime', type=float, length=HISTORY_LENGTH, desc='Digital Outputs Change Times')
+    history_pos_speed_fbk = models.Array('HISTORY:posSpeed', type=float, length=HISTORY_LENGTH, desc='Robot Speed History')
+    history_pos_speed_fbk_time = models.Array('HISTORY:posSpeedTime', type=float, length=HISTORY_LENGTH, desc='Robot Speed Change Times')
+    history_tool_fbk = models.Array('HISTORY:tool', type=float, length=HISTORY_LENGTH, desc='Tool History')
+    history_tool_fbk_time = models.Array('HISTORY:toolTime', type=float, length=HISTORY_LENGTH, desc='Tool Change Times')
+    history_lid_tool_fbk = models.Array('HISTORY:toolLid', type=float, length=HISTORY_LENGTH, desc='On Tool Lid History')
+    history_lid_tool_fbk_time = models.Array('HISTORY:toolLidTime', type=float, length=HISTORY_LENGTH, desc='On Tool Lid Change Times')
+    history_sample_tool_fbk = models.Array('HISTORY:toolSmpl', type=float, length=HISTORY_LENGTH, desc='On Tool Sample History')
+    history_sample_tool_fbk_time = models.Array('HISTORY:toolSmplTime', type=float, length=HISTORY_LENGTH, desc='On Tool Sample Change Times')
+    history_lid_diff_fbk = models.Array('HISTORY:diffLid', type=float, length=HISTORY_LENGTH, desc='On Diff Lid History')
+    history_lid_diff_fbk_time = models.Array('HISTORY:diffLidTime', type=float, length=HISTORY_LENGTH, desc='On Diff Lid Change Times')
+    history_sample_diff_fbk = models.Array('HISTORY:diffSmpl', type=float, length=HISTORY_LENGTH, desc='On Diff Sample History')
+    history_sample_diff_fbk_time = models.Array('HISTORY:diffSmplTime', type=float, length=HISTORY_LENGTH, desc='On Diff Sample Change Times')
+    history_plate_fbk = models.Array('HISTORY:plate', type=float, length=HISTORY_LENGTH, desc='Plate History')
+    history_plate_fbk_time = models.Array('HISTORY:plateTime', type=float, length=HISTORY_LENGTH, desc='Plate Change Times')
+    history_well_fbk = models.Array('HISTORY:well', type=float, length=HISTORY_LENGTH, desc='Well History')
+    history_well_fbk_time = models.Array('HISTORY:wellTime', type=float, length=HISTORY_LENGTH, desc='Well Change Times')
+    history_pos_dew1_fbk = models.Array('HISTORY:pos1', type=float, length=HISTORY_LENGTH, desc='Position Dewar 1 History')
+    history_pos_dew1_fbk_time = models.Array('HISTORY:pos1Time', type=float, length=HISTORY_LENGTH, desc='Position Dewar 1 Change Times')
+    history_pos_dew2_fbk = models.Array('HISTORY:pos2', type=float, length=HISTORY_LENGTH, desc='Position Dewar 2 History')
+    history_pos_dew2_fbk_time = models.Array('HISTORY:pos2Time', type=float, length=HISTORY_LENGTH, desc='Position Dewar 2 Change Times')
+    history_pos_x_fbk = models.Array('HISTORY:posX', type=float, length=HISTORY_LENGTH, desc='Robot X Position History')
+    history_pos_x_fbk_time = models.Array('HISTORY:posXTime', type=float, length=HISTORY_LENGTH, desc='Robot X Position Change Times')
+    history_pos_y_fbk = models.Array('HISTORY:posY', type=float, length=HISTORY_LENGTH, desc='Robot Y Position History')
+    history_pos_y_fbk_time = models.Array('HISTORY:posYTime', type=float, length=HISTORY_LENGTH, desc='Robot Y Position Change Times')
+    history_pos_z_fbk = models.Array('HISTORY:posZ', type=float, length=HISTORY_LENGTH, desc='Robot Z Position History')
+    history_pos_z_fbk_time = models.Array('HISTORY:posZTime', type=float, length=HISTORY_LENGTH, desc='Robot Z Position Change Times')
+    history_pos_rx_fbk = models.Array('HISTORY:posRX', type=float, length=HISTORY_LENGTH, desc='Robot RX Position History')
+    history_pos_rx_fbk_time = models.Array('HISTORY:posRXTime', type=float, length=HISTORY_LENGTH, desc='Robot RX Position Change Times')
+    history_pos_ry_fbk = models.Array('HISTORY:posRY', type=float, length=HISTORY_LENGTH, desc='Robot RY Position History')
+    history_pos_ry_fbk_time = models.Array('HISTORY:posRYTime', type=float, length=HISTORY_LENGTH, desc='Robot RY Position Change Times')
+    history_pos_rz_fbk = models.Array('HISTORY:posRZ', type=float, length=HISTORY_LENGTH, desc='Robot RZ Position History')
+    history_pos_rz_fbk_time = models.Array('HISTORY:posRZTime', type=float, length=HISTORY_LENGTH, desc='Robot RZ Position Change Times')
+
+    # Mount queue
+    queue_state = models.Enum('QUEUE:state', choices=ExchangeState, desc='Mount Queue State')
+    queue_remaining = models.Integer('QUEUE:remaining', desc='Ports Remaining')
+    queue_current = models.String('QUEUE:current', max_length=40, desc='Current Port')
+    exchange_count = models.Integer('QUEUE:exchanges', desc='Completed Exchanges')
+    exchange_rate = models.Float('QUEUE:rate', units='/h', desc='Samples per Hour')
+    exchange_wait = models.Float('QUEUE:waitTime', units='sec', desc='Release to Command Time')
+    exchange_start = models.Float('QUEUE:startTime', units='sec', desc='Command to Path Start Time')
+    exchange_transfer = models.Float('QUEUE:transferTime', units='sec', desc='Transfer Time')
+    exchange_collect = models.Float('QUEUE:collectTime', units='sec', desc='Mounted to Release Time')
+
+    # Operation profile
+    profile_command = models.String('PROFILE:command', max_length=40, desc='Last Profiled Command')
+    profile_total = models.Float('PROFILE:total', units='sec', desc='Last Operation Time')
+    profile_start = models.Float('PROFILE:start', units='sec', desc='Command to Path Start')
+    profile_travel = models.Float('PROFILE:travel', units='sec', desc='Travel to Diffractometer')
+    profile_prepare = models.Float('PROFILE:prepare', units='sec', desc='Prepare for Approach')
+    profile_approach = models.Float('PROFILE:approach', units='sec', desc='At Diffractometer')
+    profile_return = models.Float('PROFILE:return', units='sec', desc='Return from Diffractometer')
+    profile_count = models.Integer('PROFILE:count', desc='Operations of Last Command')
+    profile_mean = models.Float('PROFILE:mean', units='sec', desc='Mean Time of Last Command')
+
+    # Statistics
+    published_stat = models.Integer('STATS:published', desc='Status Updates Published')
+    suppressed_stat = models.Integer('STATS:suppressed', desc='Status Updates Suppressed')
+    errors_stat = models.Integer('STATS:errors', desc='Malformed Status Fields')
+    # round-trip times of the last completed trajectory command and of each trajectory command, other
+    # commands only as metrics
+    latency_cmd = models.String('LATENCY:command', max_length=40, desc='Last Completed Trajectory')
+    latency_last = models.Float('LATENCY:last', units='ms', desc='Last Trajectory Round-trip Time')
+    latency_mean = models.Float('LATENCY:mean', units='ms', desc='Mean Trajectory Round-trip Time')
+    latency_p95 = models.Float('LATENCY:p95', units='ms', desc='95th Percentile Trajectory Round-trip Time')
+    latency_put_last = models.Float('LATENCY:putLast', units='ms', desc='Put Last Round-trip Time')
+    latency_put_mean = models.Float('LATENCY:putMean', units='ms', desc='Put Mean Round-trip Time')
+    latency_put_p95 = models.Float('LATENCY:putP95', units='ms', desc='Put 95th Percentile Round-trip Time')
+    latency_get_last = models.Float('LATENCY:getLast', units='ms', desc='Get Last Round-trip Time')
+    latency_get_mean = models.Float('LATENCY:getMean', units='ms', desc='Get Mean Round-trip Time')
+    latency_get_p95 = models.Float('LATENCY:getP95', units='ms', desc='Get 95th Percentile Round-trip Time')
+    latency_getput_last = models.Float('LATENCY:getPutLast', units='ms', desc='Get Put Last Round-trip Time')
+    latency_getput_mean = models.Float('LATENCY:getPutMean', units='ms', desc='Get Put Mean Round-trip Time')
+    latency_getput_p95 = models.Float('LATENCY:getPutP95', units='ms', desc='Get Put 95th Percentile Round-trip Time')
+    latency_putplate_last = models.Float('LATENCY:putPlateLast', units='ms', desc='Put Plate Last Round-trip Time')
+    latency_putplate_mean = models.Float('LATENCY:putPlateMean', units='ms', desc='Put Plate Mean Round-trip Time')
+    latency_putplate_p95 = models.Float('LATENCY:putPlateP95', units='ms', desc='Put Plate 95th Percentile Round-trip Time')
+    latency_getplate_last = models.Float('LATENCY:getPlateLast', units='ms', desc='Get Plate Last Round-trip Time')
+    latency_getplate_mean = models.Float('LATENCY:getPlateMean', units='ms', desc='Get Plate Mean Round-trip Time')
+    latency_getplate_p95 = models.Float('LATENCY:getPlateP95', units='ms', desc='Get Plate 95th Percentile Round-trip Time')
+    latency_getputplate_last = models.Float('LATENCY:getPutPlateLast', units='ms', desc='Get Put Plate Last Round-trip Time')
+    latency_getputplate_mean = models.Float('LATENCY:getPutPlateMean', units='ms', desc='Get Put Plate Mean Round-trip Time')
+    latency_getputplate_p95 = models.Float('LATENCY:getPutPlateP95', units='ms', desc='Get Put Plate 95th Percentile Round-trip Time')
+    timeouts_stat = models.Integer('LATENCY:timeouts', desc='Command Timeouts')
+    outbox_depth = models.Integer('OUTBOX:depth', desc='Queued Commands')
+    outbox_wait = models.Float('OUTBOX:wait', units='ms', desc='Last Command Queue Wait')
+    outbox_dropped = models.Integer('OUTBOX:dropped', desc='Rejected Commands')
+    inbox_depth = models.Integer('INBOX:depth', desc='Peak Queued Messages')
+    inbox_age = models.Float('INBOX:age', units='ms', desc='Peak Message Age')
+    inbox_dropped = models.Integer('INBOX:dropped', desc='Dropped Status Messages')
+
+    # Metrics
+    status_rate = models.Float('METRICS:statusRate', units='Hz', desc='Status Lines Received')
+    command_rate = models.Float('METRICS:commandRate', units='Hz', desc='Command Lines Received')
+    query_rate = models.Float('METRICS:queryRate', units='Hz', desc='Status Queries Sent')
+    parse_mean = models.Float('METRICS:parseMean', units='us', desc='Mean Status Parse Time')
+    parse_p95 = models.Float('METRICS:parseP95', units='us', desc='95th Percentile Status Parse Time')
+    process_p95 = models.Float('METRICS:processP95', units='us', desc='95th Percentile Message Process Time')
+    inbox_metric = models.Integer('METRICS:inboxDepth', desc='Inbox Depth')
+    outbox_metric = models.Integer('METRICS:outboxDepth', desc='Outbox Depth')
+    reconnects_metric = models.Integer('METRICS:reconnects', desc='Link Reconnections')
+    link_timeouts_metric = models.Integer('METRICS:linkTimeouts', desc='Link Status Timeouts')
+
+    # Startup
+    startup_model = models.Float('STARTUP:model', units='sec', desc='Time to Create PVs')
+    startup_connect = models.Float('STARTUP:connect', units='sec', desc='Time to Connect')
+    startup_status = models.Float('STARTUP:status', units='sec', desc='Time to First Status')
 
     #options
     plates_enabled = models.Enum('OPT:plates', choices=('Plates OFF', 'Plates ON'), default=0, desc='Plates Enabled')
 
     # Params
     next_param = models.String('PAR:nextPort', max_length=40, default='', desc='Port')
+    queue_param = models.String('PAR:mountQueue', max_length=1024, default='', desc='Ports to Mount')
     lid_param = models.Enum('PAR:lid', choices=('NONE', 'LID1', 'LID2', 'LID3'), default=0, desc='Selected Lid')
     sample_param = models.Integer('PAR:smpl', min_val=0, max_val=NUM_PUCK_SAMPLES*3, default=0, desc='Selected Sample')
     tool_param = models.Enum('PAR:tool', choices=ToolType, default=2, desc='Selected Tool')
-    plate_param = models.Integer('PAR:plate', min_val=0, max_val=NUM_PLATES, desc='Selected Plate')
-    well_param = models.Integer('PAR:well', min_val=0, max_val=NUM_WELLS, desc='Selected Well')
-    plate_type = models.Enum('PAR:plateType', choices=PlateType, desc='Plate Type')
-    plate_drop = models.Integer('PAR:drop', min_val=0, max_val=NUM_PLATES, desc='Plate Drop Place')
-    adjust_x = models.Float('PAR:adjustX', units='mm', desc='X Adjust')
-    adjust_y = models.Float('PAR:adjustY', units='mm', desc='Y Adjust')
-    adjust_z = models.Float('PAR:adjustZ', units='mm', desc='Z Adjust')
-    plate_angle = models.Float('PAR:plateAng', units='deg', desc='Plate Angle')
-
-    # exposure params
-    start_angle = models.Float('PAR:startAng', units='deg', desc='Start Angle')
-    delta_angle = models.Float('PAR:delta', units='deg', desc='Delta Angle')
-    exposure = models.Float('PAR:exposure', units='sec', desc='Exposure Time')
-    steps_param = models.Integer('PAR:steps', min_val=0, desc='Exposure Steps')
-    end_angle = models.Float('PAR:endAng', units='deg', desc='End Angle')
 
     # Commands
     power_cmd = models.Toggle('CMD:power', zname='Power OFF', oname='Power ON', high=0, desc='Power')
@@ -108,6 +229,35 @@ class BobCATS(models.Model):
     set_cmd = models.Toggle('CMD:setSample', zname='Set Sample', desc='Set Sample')
     home_cmd = models.Toggle('CMD:home', zname='Home', desc='Home')
 
+    restart_cmd = models.Toggle('CMD:restart', desc='Restart')
+
+    # Simplified commands
+    dismount_cmd = models.Toggle('CMD:dismount', desc='Dismount')
+    mount_cmd = models.Toggle('CMD:mount', desc='Mount')
+    start_queue_cmd = models.Toggle('CMD:startQueue', desc='Start Mount Queue')
+    stop_queue_cmd = models.Toggle('CMD:stopQueue', desc='Stop Mount Queue')
+    release_cmd = models.Toggle('CMD:release', desc='Release Sample')
+
+
+# Plate and exposure PVs, only created once plates are enabled
+class BobCATSPlates(models.Model):
+    # Plate params
+    plate_param = models.Integer('PAR:plate', min_val=0, max_val=NUM_PLATES, desc='Selected Plate')
+    well_param = models.Integer('PAR:well', min_val=0, max_val=NUM_WELLS, desc='Selected Well')
+    plate_type = models.Enum('PAR:plateType', choices=PlateType, desc='Plate Type')
+    plate_drop = models.Integer('PAR:drop', min_val=0, max_val=NUM_PLATES, desc='Plate Drop Place')
+    adjust_x = models.Float('PAR:adjustX', units='mm', desc='X Adjust')
+    adjust_y = models.Float('PAR:adjustY', units='mm', desc='Y Adjust')
+    adjust_z = models.Float('PAR:adjustZ', units='mm', desc='Z Adjust')
+    plate_angle = models.Float('PAR:plateAng', units='deg', desc='Plate Angle')
+
+    # exposure params
+    start_angle = models.Float('PAR:startAng', units='deg', desc='Start Angle')
+    delta_angle = models.Float('PAR:delta', units='deg', desc='Delta Angle')
+    exposure = models.Float('PAR:exposure', units='sec', desc='Exposure Time')
+    steps_param = models.Integer('PAR:steps', min_val=0, desc='Exposure Steps')
+    end_angle = models.Float('PAR:endAng', units='deg', desc='End Angle')
+
     # Plate commands
     put_plate_cmd = models.Toggle('CMD:putPlate', desc='Put Plate')
     get_plate_cmd = models.Toggle('CMD:getPlate', desc='Get Plate')
@@ -116,244 +266,515 @@ class BobCATS(models.Model):
     tilt_cmd = models.Toggle('CMD:tiltPlate', desc='Tilt Plate')
     expose_cmd = models.Toggle('CMD:expose', desc='Expose')
     collect_cmd = models.Toggle('CMD:collect', desc='Collect')
-    restart_cmd = models.Toggle('CMD:restart', desc='Restart')
-
-    # Simplified commands
-    dismount_cmd = models.Toggle('CMD:dismount', desc='Dismount')
-    mount_cmd = models.Toggle('CMD:mount', desc='Mount')
-
-
-def port2args(port):
-    # converts 'L1C1' to lid=1, sample=21, tool=2 for SPINE puck where NUM_PUCK_SAMPLES = 10
-    # converts 'P2B1' to plate=2, well=24, tool=3 for Plates puck where NUM_ROW_WELLS = 24
-    if len(port) < 4: return {}
-    args = {}
-    if port.startswith('L'):
-        args = {
-            'tool': ToolType.PUCK.value,
-            'lid': zero_int(port[1]),
-            'sample' : 'ABC'.index(port[2])*NUM_PUCK_SAMPLES + zero_int(port[3:]),
-            'mode': 'puck'
-        }
-    elif port.startswith('P'):
-        args = {
-            'tool': ToolType.PLATE.value,
-            'plate': zero_int(port[1]),
-            'well': 'ABCDEFGH'.index(port[2])*NUM_ROW_WELLS + zero_int(port[3:]),
-            'mode': 'plate'
-        }
-    return args
-
-
-def pin2port(lid, sample):
-    # converts lid=1, sample=21 to 'L1C1'
-    puck, pin = divmod(sample, NUM_PUCK_SAMPLES)
-    if all((lid, pin)):
-        return 'L{}{}{}'.format(lid, 'ABC'[puck], pin)
-    else:
-        return ''
-
-
-def plate2port(plate, well):
-    # converts plate=1, well=21 to 'P1A21'
-    row, sample = divmod(well, NUM_ROW_WELLS)
-    if all((plate, sample)):
-        return 'P{}{}{}'.format(plate, 'ABCDEFGH'[row], sample)
-    else:
-        return ''
-
-
-def zero_int(text):
-    try:
-        return int(text)
-    except ValueError:
-        return 0
 
 
 class BobCATSApp(object):
-    def __init__(self, device_name, address, command_port=1000, status_port=10000):
-        self.ioc = BobCATS(device_name, callbacks=self)
-        self.inbox = Queue()
-        self.outbox = Queue()
-        self.send_on = False
-        self.recv_on = False
+    def __init__(self, device_name, address, command_port=1000, status_port=10000, poll_offset=0.0,
+                 journal_file=None, link_timeout=cats.LINK_TIMEOUT, max_delay=cats.MAX_DELAY, backend='twisted',
+                 io_map=None):
+        # address=None creates an offline application which is not connected to a controller
+        # poll_offset delays status polling after connecting, to stagger several robots
+        # journal_file records all commands, responses and status changes to a binary journal
+        # link_timeout is the time without status replies after which both links are re-established
+        # max_delay is the longest time between reconnection attempts
+        # backend 'asyncio' uses asyncio streams for the controller links, the reactor must then be asyncioreactor
+        # io_map is an INI file naming the di and do bits, see dio.load_bit_map
+        self.device_name = device_name
+        self.clock = time.time     # source of status, profile and exchange times, see set_clock
+        self.journal = journal.JournalWriter(journal_file) if journal_file else None
+        self.poll_offset = poll_offset
+        self.started = time.time()
+        self.startup = {}
+        self.ioc = None
+        self.plates = None
+        self.parser = None
+        self.derived = None
+        self.decoder = StatusDecoder()
+        self.outbox = CommandQueue()
+        self.inbox = MessageInbox()
+        self.receiving = False
+        self.monitor = task.LoopingCall(self.status_monitor)
         self.user_enabled = False
         self.ready = False
-        self.command_client = cats.CommandFactory(self)
-        self.status_client = cats.StatusFactory(self)
-        self.pending_clients = {self.command_client.protocol.message_type, self.status_client.protocol.message_type}
-
-        reactor.connectTCP(address, status_port, self.status_client)
-        reactor.connectTCP(address, command_port, self.command_client)
-
-        # status pvs and conversion types
-        self.status_map = [
-            (self.ioc.power_fbk, int), (self.ioc.mode_fbk, int), (self.ioc.default_fbk, int),
-            (self.ioc.tool_fbk, zero_int), (self.ioc.path_fbk, str), (self.ioc.lid_tool_fbk, zero_int),
-            (self.ioc.sample_tool_fbk, zero_int), (self.ioc.sample_diff_fbk, zero_int), (self.ioc.lid_diff_fbk, zero_int),
-            (self.ioc.sample_diff_fbk, zero_int), (self.ioc.plate_fbk, zero_int), (self.ioc.well_fbk, zero_int),
-            (self.ioc.barcode_fbk, str), (self.ioc.running_fbk, int), (self.ioc.ln2_dew1_fbk, int),
-            (self.ioc.ln2_dew2_fbk, int), (self.ioc.speed_fbk, int), (self.ioc.pucks_dew1_fbk, str),
-            (self.ioc.pucks_dew2_fbk, str), (self.ioc.pos_dew1_fbk, zero_int), (self.ioc.pos_dew2_fbk, zero_int)
-        ]
+        self.poller = PollScheduler()
+        self.inventory = Inventory()
+        self.exchange = MountQueue(self)
+        self.profiler = CycleProfiler(self)
+        self.history = StatusHistory()
+        self.history_time = 0
+        self.dio = dio.DigitalIO(dio.load_bit_map(io_map) if io_map else None)
+        self.stats_time = 0
+        self.link_timeout = link_timeout
+        self.link_time = 0
+        self.link_timeouts = 0
+        self.link_monitor = task.LoopingCall(self.check_link)
+        if backend == 'asyncio':
+            from . import aiocats   # python 3 only
+            self.command_client = aiocats.LinkClient(self, cats.MessageType.RESPONSE, max_delay=max_delay)
+            self.status_client = aiocats.LinkClient(self, cats.MessageType.STATUS, max_delay=max_delay)
+        else:
+            self.command_client = cats.CommandFactory(self, max_delay=max_delay)
+            self.status_client = cats.StatusFactory(self, max_delay=max_delay)
+        self.pending_clients = {self.command_client.message_type, self.status_client.message_type}
+        self.setup_metrics()
+
+        if address:
+            # the process variables are created while the connections are being established
+            if backend == 'asyncio':
+                self.status_client.start(address, status_port)
+                self.command_client.start(address, command_port)
+            else:
+                reactor.connectTCP(address, status_port, self.status_client)
+                reactor.connectTCP(address, command_port, self.command_client)
+            reactor.callLater(0, self.build)
+        else:
+            self.build()
+
+    def build(self):
+        # create the process variables and the decoders publishing to them, only once
+        if self.ioc is not None:
+            return
+        self.ioc = BobCATS(self.device_name, callbacks=self)
+        self.parser = StatusParser(self.ioc, self.decoder, self.clock)
+        self.derived = DerivedState(self.ioc, self.decoder)
+        self.dio.build(self.device_name)
+        self.startup_phase('model')
+
+    def set_clock(self, clock):
+        """
+        Replace the time source, for example with the recorded times of a replayed journal.
+
+        :param clock: callable returning the current time in seconds since the epoch
+        """
+        self.clock = clock
+        if self.parser is not None:
+            self.parser.clock = clock
+
+    def startup_phase(self, phase):
+        # record the time from application start to the first occurrence of each startup phase
+        if phase in self.startup:
+            return
+        elapsed = self.startup[phase] = time.time() - self.started
+        logger.info('{} startup: {} after {:0.3f} s'.format(self.device_name, phase, elapsed))
+        getattr(self.ioc, 'startup_{}'.format(phase)).put(elapsed)
+
+    def enable_plates(self):
+        if self.plates is None:
+            start = time.time()
+            self.plates = BobCATSPlates(self.device_name, callbacks=self)
+            logger.info('{} plate PVs created in {:0.3f} s'.format(self.device_name, time.time() - start))
+
+    def setup_metrics(self):
+        registry = self.metrics = metrics.Registry(device=self.device_name)
+        registry.counter('bobcats_status_lines_total', 'Lines received on the status link', lambda: self.status_client.received)
+        registry.counter('bobcats_command_lines_total', 'Lines received on the command link', lambda: self.command_client.received)
+        registry.counter('bobcats_status_queries_total', 'Status queries sent', lambda: self.status_client.sent)
+        registry.counter('bobcats_commands_total', 'Commands sent', lambda: self.command_client.sent)
+        registry.counter('bobcats_reconnects_total', 'Link reconnections', self.reconnects)
+        registry.counter('bobcats_link_timeouts_total', 'Links dropped for lack of status replies', lambda: self.link_timeouts)
+        registry.counter('bobcats_published_total', 'Status fields published', lambda: self.decoder.published)
+        registry.counter('bobcats_suppressed_total', 'Unchanged status fields suppressed', lambda: self.decoder.suppressed)
+        registry.counter('bobcats_inbox_dropped_total', 'Superseded status messages dropped', lambda: self.inbox.dropped)
+        registry.counter('bobcats_outbox_dropped_total', 'Commands rejected by a full outbox', lambda: self.outbox.dropped)
+        registry.counter('bobcats_outbox_flushed_total', 'Motion commands discarded by safety commands', lambda: self.outbox.flushed)
+        registry.labelled_counter(
+            'bobcats_command_replies_total', 'Command responses received', 'command',
+            lambda: {name: stats.count for name, stats in self.command_client.latency.items()}
+        )
+        registry.labelled_counter(
+            'bobcats_command_timeouts_total', 'Commands without a response', 'command',
+            lambda: {name: stats.timeouts for name, stats in self.command_client.latency.items()}
+        )
+        registry.labelled_gauge(
+            'bobcats_command_latency_seconds', 'Mean command round-trip time', 'command',
+            lambda: {name: stats.mean for name, stats in self.command_client.latency.items()}
+        )
+        registry.labelled_gauge(
+            'bobcats_command_latency_p95_seconds', '95th percentile of recent command round-trip times', 'command',
+            lambda: {name: stats.percentile(95) for name, stats in self.command_client.latency.items()}
+        )
+        if self.journal:
+            registry.counter('bobcats_journal_dropped_total', 'Journal records dropped', lambda: self.journal.dropped)
+        registry.gauge('bobcats_connected', 'Both controller links connected', lambda: int(self.ready))
+        registry.gauge('bobcats_inbox_depth', 'Messages waiting in the inbox', lambda: len(self.inbox))
+        registry.gauge('bobcats_outbox_depth', 'Commands waiting in the outbox', lambda: len(self.outbox))
+        registry.gauge('bobcats_inflight_commands', 'Commands awaiting a response', lambda: len(self.command_client.pending))
+        self.parse_time = registry.histogram('bobcats_parse_seconds', 'Status reply parse time')
+        self.process_time = registry.histogram('bobcats_process_seconds', 'Received message process time')
+        self.metrics_state = (time.time(), 0, 0, 0, 0, 0.0, self.parse_time.snapshot(), self.process_time.snapshot())
+        self.metrics_monitor = task.LoopingCall(self.publish_metrics)
+        self.metrics_monitor.start(METRICS_TIME, now=False)
+
+    def reconnects(self):
+        return max(0, self.command_client.connections - 1) + max(0, self.status_client.connections - 1)
+
+    def publish_metrics(self):
+        if self.ioc is None:
+            return
+        now = time.time()
+        status_lines, command_lines, queries = (
+            self.status_client.received, self.command_client.received, self.status_client.sent
+        )
+        (last_time, last_status, last_command, last_queries, last_parses, last_parse_total, parse_counts,
+         process_counts) = self.metrics_state
+        parses = self.parse_time.count - last_parses
+        elapsed = max(now - last_time, 1e-6)
+        self.ioc.status_rate.put((status_lines - last_status) / elapsed)
+        self.ioc.command_rate.put((command_lines - last_command) / elapsed)
+        self.ioc.query_rate.put((queries - last_queries) / elapsed)
+        if parses:
+            self.ioc.parse_mean.put((self.parse_time.total - last_parse_total) / parses * 1e6)
+        self.ioc.parse_p95.put(self.parse_time.quantile(0.95, since=parse_counts) * 1e6)
+        self.ioc.process_p95.put(self.process_time.quantile(0.95, since=process_counts) * 1e6)
+        self.ioc.inbox_metric.put(len(self.inbox))
+        self.ioc.outbox_metric.put(len(self.outbox))
+        self.ioc.reconnects_metric.put(self.reconnects())
+        self.ioc.link_timeouts_metric.put(self.link_timeouts)
+        self.metrics_state = (
+            now, status_lines, command_lines, queries, self.parse_time.count, self.parse_time.total,
+            self.parse_time.snapshot(), self.process_time.snapshot()
+        )
 
     def ready_for_commands(self):
         return self.ready and self.ioc.enabled.get() and self.ioc.connected.get()
 
     def sender(self):
-        self.send_on = True
-        epics.threads_init()
-        while self.send_on:
-            command = self.outbox.get()
-            logger.debug('< {}'.format(command))
-            try:
-                self.command_client.send_message(command)
-            except Exception as e:
-                logger.error(e)
-            time.sleep(0)
-
-    def receiver(self):
-        self.recv_on = True
-        epics.threads_init()
-        while self.recv_on:
-            message, message_type = self.inbox.get()
-            logger.debug('> {}'.format(message))
+        # Only one command is in flight at a time, safety commands are never held back
+        next_command = self.outbox.peek()
+        while next_command and (next_command.priority == SAFETY or not self.command_client.pending):
+            queued = self.outbox.get()
+            if queued is None:
+                break
+            command = queued.message
+            self.ioc.outbox_wait.put(queued.wait * 1000)
             try:
-                self.process_message(message, message_type)
+                reply = self.command_client.send_command(command)
+                if not isinstance(reply, defer.Deferred):
+                    reply = defer.Deferred.fromFuture(reply)   # asyncio links return futures
             except Exception as e:
                 logger.error(e)
-            time.sleep(0)
+            else:
+                self.command_sent(command)
+                reply.addCallbacks(
+                    self.on_command_reply, self.on_command_failure, callbackArgs=(command,), errbackArgs=(command,)
+                )
+            next_command = self.outbox.peek()
+        self.ioc.outbox_depth.put(len(self.outbox))
+
+    def command_sent(self, command):
+        logger.debug('< {}'.format(command))
+        if self.journal:
+            self.journal.record(journal.COMMAND, command)
+        self.profiler.command_sent(command)
+
+    def on_command_reply(self, reply, command):
+        name = command.split('(', 1)[0].strip()
+        stats = self.command_client.latency.get(name)
+        if stats and name in cats.TRAJECTORY_COMMANDS:
+            last, mean, p95 = stats.last * 1000, stats.mean * 1000, stats.percentile(95) * 1000
+            self.ioc.latency_cmd.put(name)
+            self.ioc.latency_last.put(last)
+            self.ioc.latency_mean.put(mean)
+            self.ioc.latency_p95.put(p95)
+            getattr(self.ioc, 'latency_{}_last'.format(name)).put(last)
+            getattr(self.ioc, 'latency_{}_mean'.format(name)).put(mean)
+            getattr(self.ioc, 'latency_{}_p95'.format(name)).put(p95)
+        if cats.is_error(reply):
+            self.exchange.command_failed(command, reply)
+            self.profiler.command_failed(command, reply)
+        self.sender()
+        return reply
+
+    def on_command_failure(self, failure, command):
+        logger.error('Command failed: {} ({})'.format(command, failure.getErrorMessage()))
+        if failure.check(cats.CommandTimeout):
+            self.ioc.timeouts_stat.put(sum(stats.timeouts for stats in self.command_client.latency.values()))
+            self.ioc.warning.put('Command timed out: {}'.format(command)[:40])
+        self.exchange.command_failed(command, failure.getErrorMessage())
+        self.profiler.command_failed(command, failure.getErrorMessage())
+        if self.ready:
+            self.sender()
 
     def status_monitor(self):
-        epics.threads_init()
-        self.recv_on = True
-        commands = ['state', 'di', 'do', 'position']
-        cmd_index = 0
-        while self.recv_on:
-            self.status_client.send_message(commands[cmd_index])
-            cmd_index = (cmd_index + 1) % len(commands)
-            time.sleep(STATUS_TIME)
+        for query in self.poller.due_queries():
+            self.status_client.send_message(query)
+
+    def start_monitor(self):
+        if self.ready and not self.monitor.running:
+            self.monitor.start(STATUS_TIME)
+
+    def check_link(self):
+        # a half-open link is only noticed when status replies stop arriving
+        last = max(self.status_client.last_received, self.link_time)
+        if self.ready and time.time() - last > self.link_timeout:
+            self.link_timeouts += 1
+            logger.error('{} No status for {:0.1f} s, re-establishing links'.format(
+                self.device_name, time.time() - last
+            ))
+            self.resync()
+
+    def resync(self):
+        # drop both links together so that they reconnect and resynchronize as a pair
+        self.command_client.drop()
+        self.status_client.drop()
 
     def disconnect(self, client_type):
+        self.build()
         self.pending_clients.add(client_type)
-        self.recv_on = False
-        self.send_on = False
+        if self.ready:
+            self.ready = False
+            self.resync()
+        if self.monitor.running:
+            self.monitor.stop()
+        if self.link_monitor.running:
+            self.link_monitor.stop()
         self.ioc.connected.put(0)
 
     def connect(self, client_type):
+        self.build()
         self.pending_clients.remove(client_type)
 
         # all clients connected
         if not self.pending_clients:
-            self.inbox.queue.clear()
-            self.outbox.queue.clear()
-            send_thread = Thread(target=self.sender)
-            recv_thread = Thread(target=self.receiver)
-            status_thread = Thread(target=self.status_monitor)
-            send_thread.setDaemon(True)
-            recv_thread.setDaemon(True)
-            status_thread.setDaemon(True)
-            send_thread.start()
-            recv_thread.start()
-            status_thread.start()
+            self.parser.reset()
+            self.derived.reset()
+            self.poller.reset()
+            self.outbox.clear()
+            self.inbox.clear()
             self.ready = True
+            self.exchange.stop()
+            self.profiler.reset()
+            self.link_time = time.time()
+            if not self.link_monitor.running:
+                self.link_monitor.start(self.link_timeout / 4, now=False)
+            reactor.callLater(self.poll_offset, self.start_monitor)
             self.ioc.connected.put(1)
-            logger.warn('Controller ready!')
+            self.startup_phase('connect')
+            logger.warn('{} Controller ready!'.format(self.device_name))
         else:
             self.ready = False
 
     def shutdown(self):
         logger.warn('Shutting down ...')
-        self.recv_on = False
-        self.send_on = False
-        self.ioc.shutdown()
+        if self.monitor.running:
+            self.monitor.stop()
+        if self.link_monitor.running:
+            self.link_monitor.stop()
+        if self.metrics_monitor.running:
+            self.metrics_monitor.stop()
+        for client in (self.command_client, self.status_client):
+            if hasattr(client, 'stop'):
+                client.stop()
+        if self.journal:
+            self.journal.close()
+        if self.profiler.has_data():
+            logger.info('Operation profile:\n{}'.format(self.profiler.summary()))
+        if self.plates is not None:
+            self.plates.shutdown()
+        self.dio.shutdown()
+        if self.ioc is not None:
+            self.ioc.shutdown()
 
     def send_command(self, command, *args):
         if self.ready_for_commands():
-            if args:
-                cmd = '{}({})'.format(command, ','.join([str(arg) for arg in args]))
+            cmd = format_command(command, *args)
+            self.poller.wake()
+            flushed = self.outbox.flushed
+            if self.outbox.put(cmd):
+                if self.outbox.flushed > flushed:
+                    logger.warning('{} discarded {} waiting motion commands'.format(cmd, self.outbox.flushed - flushed))
+                # PV callbacks may arrive from other threads, the transport is only touched by the reactor
+                reactor.callFromThread(self.sender)
             else:
-                cmd = command
-            self.outbox.put(cmd)
+                logger.warning('Command queue full, command rejected: {}'.format(cmd))
+                self.ioc.outbox_dropped.put(self.outbox.dropped)
+                return False
+            return True
+        return False
 
     def receive_message(self, message, message_type):
-        self.inbox.put((message, message_type))
+        # only the newest status reply of each context is kept, responses are never dropped
+        if message_type == cats.MessageType.STATUS:
+            self.inbox.put(message, message_type, message.split('(', 1)[0])
+        else:
+            self.inbox.put(message, message_type)
+        if not self.receiving:
+            self.receiving = True
+            reactor.callLater(0, self.receiver)
+
+    def receiver(self):
+        self.receiving = False
+        item = self.inbox.get()
+        while item:
+            logger.debug('> {}'.format(item.message))
+            start = metrics.clock()
+            try:
+                self.process_message(item.message, item.message_type)
+            except Exception as e:
+                logger.error(e)
+            self.process_time.observe(metrics.clock() - start)
+            item = self.inbox.get()
 
     def process_message(self, message, message_type):
         if message_type == cats.MessageType.STATUS:
             # process state messages
+            start = metrics.clock()
             self.parse_status(message)
+            self.parse_time.observe(metrics.clock() - start)
         else:
             # process response messages
+            if self.journal:
+                self.journal.record(journal.RESPONSE, message)
             self.ioc.log.put(message)
 
     def parse_status(self, message):
-        patt = re.compile('^(?P<context>\w+)\((?P<msg>.*?)\)')
-        m = patt.match(message)
-        if m:
-            details = m.groupdict()
-            if details['context'] == 'state':
-                for i, value in enumerate(details['msg'].split(',')):
-                    variable, converter = self.status_map[i]
-                    try:
-                        variable.put(converter(value))
-                    except ValueError:
-                        logger.warning('Unable to parse state: {}'.format(message))
-                if self.ioc.mode_fbk.get() == 1 and self.ioc.default_fbk.get() == 1:
-                    if self.ioc.running_fbk.get():
-                        self.ioc.status.put(StatusType.BUSY.value)
-                    else:
-                        self.ioc.status.put(StatusType.IDLE.value)
-                else:
-                    self.ioc.status.put(StatusType.ERROR.value)
-            elif details['context'] == 'do':
-                self.ioc.outputs_fbk.put(int(details['msg'].replace(',', ''), 2))
-            elif details['context'] == 'di':
-                self.ioc.inputs_fbk.put(int(details['msg'].replace(',', ''), 2))
+        context, changes = self.parser.parse(message)
+        if context:
+            self.poller.replied(context)
+        if changes and self.journal:
+            self.journal.record(journal.STATUS, message)
+        if changes and context != 'state':
+            self.history.record_reply(context, self.decoder, self.clock())
+            if context in self.dio.decoders:
+                for bit, value in self.dio.update(context, self.decoder.raw[context], self.clock()):
+                    if bit.name in SAFETY_FLAGS:
+                        self.profiler.set_safety(bit.name, value)
+        if context == 'state':
+            self.exchange.check()
+            self.profiler.check()
+        if context == 'state' and changes:
+            self.startup_phase('status')
+            state = self.parser.snapshot
+            self.ioc.sequence_fbk.put(state.sequence)
+            changed = self.parser.changed
+            self.history.record_state(state, changed)
+            self.poller.set_running(state.get('running_fbk'))
+            updated = self.derived.update(state, changed)
+            inventory = False
+            if 'pucks_dew1_fbk' in changed:
+                # only dewar 1 has ports, see inventory.DEWAR_PUCKS
+                inventory |= self.inventory.update_pucks(1, state.get('pucks_dew1_fbk', ''))
+            if 'mounted_fbk' in updated:
+                inventory |= self.inventory.update_mounted(self.derived.get('mounted_fbk'))
+            if 'tooled_fbk' in updated:
+                inventory |= self.inventory.update_tooled(self.derived.get('tooled_fbk'))
+            if inventory:
+                self.publish_inventory()
+            self.exchange.update(state)
+            self.profiler.update(state)
+        self.report_stats()
+        self.publish_history()
+
+    @property
+    def snapshot(self):
+        """
+        Consistent StatusSnapshot of all state fields from the latest state reply.
+        """
+        return self.parser.snapshot
+
+    def publish_inventory(self):
+        self.ioc.inventory_ports.put(self.inventory.ports)
+        self.ioc.inventory_pucks.put(self.inventory.pucks)
+
+    def history_window(self, start=None, end=None, names=None):
+        """
+        Recorded status changes within a time window.
+
+        :param start: earliest timestamp, None for the oldest change
+        :param end: latest timestamp, None for the newest change
+        :param names: field names such as 'running_fbk', all recorded fields if not given
+        :return: dictionary mapping field names to lists of (timestamp, value) tuples
+        """
+        return self.history.query(start, end, names)
+
+    def publish_history(self):
+        now = time.time()
+        if self.history.dirty and now - self.history_time >= HISTORY_TIME:
+            self.history_time = now
+            self.history.publish(self.ioc)
+
+    def report_stats(self):
+        now = time.time()
+        if now - self.stats_time >= STATS_TIME:
+            self.stats_time = now
+            self.ioc.published_stat.put(self.decoder.published)
+            self.ioc.suppressed_stat.put(self.decoder.suppressed)
+            self.ioc.errors_stat.put(sum(self.parser.errors.values()))
+            self.ioc.inbox_depth.put(self.inbox.max_depth)
+            self.ioc.inbox_age.put(self.inbox.max_age * 1000)
+            self.ioc.inbox_dropped.put(self.inbox.dropped)
+            self.inbox.reset_stats()
 
     # callbacks
+    def mount_port(self, port):
+        # sends put or getput for pucks, putplate or getputplate for plates, returns False if not sent
+        if not self.state_known():
+            return False
+        if PORT_ARGS.get(port, {}).get('mode') == 'plate':
+            if self.plates is None:
+                self.ioc.warning.put('Plates are not enabled!')
+                return False
+            occupied = self.derived.get('tooled_fbk', '')
+            return self.send_checked(commands.mount_command, port, occupied, self.plates.plate_type.get())
+        else:
+            return self.send_checked(commands.mount_command, port, self.derived.get('mounted_fbk', ''))
+
+    def state_known(self):
+        # mounts depend on what is on the diffractometer and the tool, unknown until the first state reply
+        if 'running_fbk' in self.parser.snapshot:
+            return True
+        self.ioc.warning.put('Robot state not known yet')
+        return False
+
+    def send_checked(self, builder, *args):
+        # builds and validates a command with one of the commands builders before sending it
+        try:
+            command = builder(*args)
+        except commands.CommandError as e:
+            self.ioc.warning.put(str(e)[:40])
+            return False
+        return self.send_command(command)
+
     def do_mount_cmd(self, pv, value, ioc):
         if value:
-            port = ioc.next_param.get().strip()
-            current = ioc.mounted_fbk.get().strip()
-            params = port2args(port)
-            plate_type = ioc.plate_type.get()
-            if all(params.values()):
-                if params['mode'] == 'puck':
-                    command = 'put' if not current else 'getput'
-                    args = (params['tool'], params['lid'], params['sample']) + 10 * (0,)
-                elif params['mode'] == 'plate':
-                    ontool = ioc.tooled_fbk.get().strip()
-                    command = 'putplate' if not ontool else 'getputplate'
-                    args = (params['tool'],) + 4*(0, )+(params['plate'], params['well'], plate_type)
-                else:
-                    return
-                self.send_command(command, *args)
+            self.mount_port(ioc.next_param.get().strip())
 
-    def do_dismount_cmd(self, pv, value, ioc):
+    def do_queue_param(self, pv, value, ioc):
+        # the queue is only changed by the reactor, which may be issuing the next exchange
+        invalid = self.exchange.validate(value)
+        if invalid:
+            ioc.warning.put('Invalid ports: {}'.format(','.join(invalid))[:40])
+        else:
+            reactor.callFromThread(self.exchange.load, value)
+
+    def do_start_queue_cmd(self, pv, value, ioc):
+        if value:
+            reactor.callFromThread(self.exchange.start)
+
+    def do_stop_queue_cmd(self, pv, value, ioc):
+        if value:
+            reactor.callFromThread(self.exchange.stop)
+
+    def do_release_cmd(self, pv, value, ioc):
         if value:
-            current = ioc.mounted_fbk.get().strip()
-            params = port2args(current)
-            if all(params.values()):
-                if params['mode'] == 'puck':
-                    command = 'get'
-                elif params['mode'] == 'plate':
-                    command = 'getplate'
-                else:
-                    return
+            reactor.callFromThread(self.exchange.release)
+
+    def do_dismount_cmd(self, pv, value, ioc):
+        if value and self.state_known():
+            params = PORT_ARGS.get(self.derived.get('mounted_fbk', ''))
+            if params:
+                command = 'get' if params['mode'] == 'puck' else 'getplate'
                 self.send_command(command, params['tool'])
 
-    def do_sample_diff_fbk(self, pv, value, ioc):
-        port = pin2port(ioc.lid_diff_fbk.get(), value)
-        ioc.mounted_fbk.put(port)
+    def do_approach(self, pv, value, ioc):
+        reactor.callFromThread(self.profiler.set_safety, 'approach', value)
 
-    def do_sample_tool_fbk(self, pv, value, ioc):
-        port = pin2port(ioc.lid_tool_fbk.get(), value)
-        ioc.tooled_fbk.put(port)
+    def do_prepare(self, pv, value, ioc):
+        reactor.callFromThread(self.profiler.set_safety, 'prepare', value)
 
-    def do_well_fbk(self, pv, value, ioc):
-        port = plate2port(ioc.plate_fbk.get(), value)
-        ioc.tooled_fbk.put(port)
+    def do_plates_enabled(self, pv, value, ioc):
+        if value:
+            reactor.callFromThread(self.enable_plates)
 
     def do_lid_cmd(self, pv, value, ioc):
         lid = ioc.lid_param.get()
@@ -368,8 +789,7 @@ class BobCATSApp(object):
         sample = ioc.sample_param.get()
         tool = ioc.tool_param.get()
         if value and lid and sample and tool == ToolType.PUCK.value:
-            args = (tool, lid, sample) + 10*(0, )
-            self.send_command('put', *args)
+            self.send_checked(commands.puck_command, 'put', tool, lid, sample)
 
     def do_get_cmd(self, pv, value, ioc):
         tool = ioc.tool_param.get()
@@ -381,8 +801,7 @@ class BobCATSApp(object):
         sample = ioc.sample_param.get()
         tool = ioc.tool_param.get()
         if value and lid and sample and tool == ToolType.PUCK.value:
-            args = (tool, lid, sample) + 10*(0, )
-            self.send_command('getput', *args)
+            self.send_checked(commands.puck_command, 'getput', tool, lid, sample)
 
     def do_pause_cmd(self, pv, value, ioc):
         if value:
@@ -415,6 +834,7 @@ class BobCATSApp(object):
     def do_abort_cmd(self, pv, value, ioc):
         if value :
             self.send_command('abort')
+            reactor.callFromThread(self.exchange.stop)
 
     def do_restart_cmd(self, pv, value, ioc):
         if value :
@@ -438,13 +858,12 @@ class BobCATSApp(object):
         plate = ioc.plate_param.get()
         plate_type = ioc.plate_type.get()
         well = ioc.well_param.get()
-        tool = ioc.tool_param.get()
-        if ioc.plates_enabled.get() and value and plate and plate_type and tool == ToolType.PLATE.value:
-            args = (tool,) + 4*(0, )+(plate, well, plate_type)
-            self.send_command('putplate', *args)
+        tool = self.ioc.tool_param.get()
+        if self.ioc.plates_enabled.get() and value and plate and plate_type and tool == ToolType.PLATE.value:
+            self.send_checked(commands.plate_command, 'putplate', tool, plate, well, plate_type)
 
     def do_get_plate_cmd(self, pv, value, ioc):
-        tool = ioc.tool_param.get()
+        tool = self.ioc.tool_param.get()
         if value and tool == ToolType.PLATE.value:
             self.send_command('getplate', tool)
 
@@ -452,33 +871,29 @@ class BobCATSApp(object):
         plate = ioc.plate_param.get()
         plate_type = ioc.plate_type.get()
         well = ioc.well_param.get()
-        tool = ioc.tool_param.get()
+        tool = self.ioc.tool_param.get()
         drop = ioc.plate_drop.get()
-        if ioc.plates_enabled.get() and value and plate and plate_type and tool == ToolType.PLATE.value:
-            args =  (tool,) + 4*(0, )+(plate, well, plate_type,drop)
-            self.send_command('getputplate', *args)
+        if self.ioc.plates_enabled.get() and value and plate and plate_type and tool == ToolType.PLATE.value:
+            self.send_checked(commands.plate_command, 'getputplate', tool, plate, well, plate_type, drop)
 
     def do_adjust_cmd(self, pv, value, ioc):
         x = ioc.adjust_x.get()
         y = ioc.adjust_y.get()
-        tool = ioc.tool_param.get()
-        if value and ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
-            args =  (tool,) + 9*(0, )+(x, y)
-            self.send_command('adjust', *args)
+        tool = self.ioc.tool_param.get()
+        if value and self.ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
+            self.send_checked(commands.adjust_command, tool, x, y)
 
     def do_tilt_cmd(self, pv, value, ioc):
         ang = ioc.plate_angle.get()
-        tool = ioc.tool_param.get()
-        if value and ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
-            args = (tool,) + 12 * (0,) + (ang,)
-            self.send_command('plateangle', *args)
+        tool = self.ioc.tool_param.get()
+        if value and self.ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
+            self.send_checked(commands.tilt_command, tool, ang)
 
     def do_focus_cmd(self, pv, value, ioc):
         z = ioc.adjust_z.get()
-        tool = ioc.tool_param.get()
-        if value and ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
-            args = (tool,) + 11 * (0,) + (z,)
-            self.send_command('focus', *args)
+        tool = self.ioc.tool_param.get()
+        if value and self.ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
+            self.send_checked(commands.focus_command, tool, z)
 
     def do_expose_cmd(self, pv, value, ioc):
         start = ioc.start_angle.get()
@@ -486,11 +901,10 @@ class BobCATSApp(object):
         exposure = ioc.exposure.get()
         steps = ioc.steps_param.get()
         end_angle = ioc.end_angle.get()
-        tool = ioc.tool_param.get()
+        tool = self.ioc.tool_param.get()
 
-        if value and ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
-            args = (tool,) + 12 * (0,) + (start, delta, exposure, steps)
-            self.send_command('expose', *args)
+        if value and self.ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
+            self.send_checked(commands.exposure_command, 'expose', tool, start, delta, exposure, steps)
 
     def do_collect_cmd(self, pv, value, ioc):
         start = ioc.start_angle.get()
@@ -498,8 +912,7 @@ class BobCATSApp(object):
         exposure = ioc.exposure.get()
         steps = ioc.steps_param.get()
         end_angle = ioc.end_angle.get()
-        tool = ioc.tool_param.get()
+        tool = self.ioc.tool_param.get()
 
-        if value and ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
-            args = (tool,) + 12 * (0,) + (start, delta, exposure, steps, end_angle)
-            self.send_command('collect', *args)
+        if value and self.ioc.plates_enabled.get() and tool == ToolType.PLATE.value:
+            self.send_checked(commands.exposure_command, 'collect', tool, start, delta, exposure, steps, end_angle)
@@ -0,0 +1,192 @@
+"""
+Binary journal of commands, responses and status changes, and its replay through an offline IOC.
+Replay drives status decoding and response handling but not the command callbacks, and runs with the
+recorded times, see Replayer.
+"""
+import struct
+import threading
+import time
+
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+from softdev import log
+from twisted.internet import reactor, defer
+
+logger = log.get_module_logger(__name__)
+
+# record kinds
+COMMAND, RESPONSE, STATUS = range(3)
+KIND_NAMES = ('COMMAND', 'RESPONSE', 'STATUS')
+
+MAGIC = b'BCJ1'
+HEADER = struct.Struct('<dBH')  # timestamp, kind, payload length
+MAX_PAYLOAD = 0xFFFF
+BUFFER_SIZE = 64 * 1024
+FLUSH_TIME = 1.0
+QUEUE_SIZE = 10000      # records waiting to be written before new records are dropped
+
+
+class JournalWriter(object):
+    """
+    Append-only binary journal of commands, responses and status changes. Records are queued by
+    the caller and encoded and written by a background thread through a buffered file. Records are
+    dropped and counted if the writer falls behind or has stopped after an error.
+
+    Each record is a little-endian header (timestamp double, kind byte, payload length ushort)
+    followed by the UTF-8 payload.
+
+    :param filename: journal file, new records are appended to existing journals
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.queue = Queue(QUEUE_SIZE)
+        self.handle = open(filename, 'ab', BUFFER_SIZE)
+        if self.handle.tell() == 0:
+            self.handle.write(MAGIC)
+        self.records = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self.writer)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def record(self, kind, text):
+        if not self.thread.is_alive():
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait((time.time(), kind, text))
+        except Full:
+            self.dropped += 1
+
+    def writer(self):
+        last_flush = time.time()
+        while True:
+            try:
+                item = self.queue.get(timeout=FLUSH_TIME)
+            except Empty:
+                item = ()
+            if item is None:
+                break
+            try:
+                if item:
+                    timestamp, kind, text = item
+                    if not isinstance(text, bytes):
+                        text = text.encode('utf-8')
+                    payload = text[:MAX_PAYLOAD]
+                    self.handle.write(HEADER.pack(timestamp, kind, len(payload)))
+                    self.handle.write(payload)
+                    self.records += 1
+                if time.time() - last_flush >= FLUSH_TIME:
+                    last_flush = time.time()
+                    self.handle.flush()
+            except Exception as e:
+                self.errors += 1
+                self.dropped += int(bool(item))
+                logger.error('Unable to write journal {}: {}'.format(self.filename, e))
+        try:
+            self.handle.close()
+        except Exception as e:
+            logger.error('Unable to close journal {}: {}'.format(self.filename, e))
+
+    def close(self):
+        try:
+            self.queue.put(None, timeout=FLUSH_TIME)
+        except Full:
+            logger.error('Journal {} not closed, writer is not responding'.format(self.filename))
+            return
+        self.thread.join(5 * FLUSH_TIME)
+
+
+def read_journal(filename):
+    """
+    Iterate over the records of a journal.
+
+    :param filename: journal file
+    :return: generator of (timestamp, kind, text) tuples
+    """
+    with open(filename, 'rb') as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Not a BobCATS journal: {}'.format(filename))
+        while True:
+            header = handle.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            timestamp, kind, length = HEADER.unpack(header)
+            payload = handle.read(length)
+            if len(payload) < length:
+                break
+            yield timestamp, kind, payload.decode('utf-8')
+
+
+class Replayer(object):
+    """
+    Feeds a journal back through an application. Status records go through parse_status, responses
+    through process_message and commands through command_sent.
+
+    The journal holds the commands as sent on the wire rather than the PV writes which produced
+    them, so replayed commands only reach the journal and the profiler. The do_* callbacks, the
+    outbox and the mount queue are not driven by a replay.
+
+    The application clock is replaced by the timestamp of the record being dispatched, so that
+    snapshot, history, I/O event, exchange and profile times are those of the recording.
+
+    :param app: BobCATSApp instance, normally offline
+    :param filename: journal file
+    """
+
+    def __init__(self, app, filename):
+        self.app = app
+        self.records = list(read_journal(filename))
+        self.counts = [0, 0, 0]
+        self.now = self.records[0][0] if self.records else time.time()
+        app.set_clock(self.clock)
+
+    def clock(self):
+        return self.now
+
+    def dispatch(self, kind, text, timestamp):
+        self.counts[kind] += 1
+        self.now = timestamp
+        try:
+            if kind == STATUS:
+                self.app.parse_status(text)
+            elif kind == RESPONSE:
+                self.app.process_message(text, self.app.command_client.message_type)
+            elif kind == COMMAND:
+                self.app.command_sent(text)
+        except Exception as e:
+            logger.error('Replay failed for {}: {}'.format(text, e))
+
+    def run(self):
+        """
+        Replay all records as fast as possible.
+
+        :return: records per second
+        """
+        start = time.time()
+        for timestamp, kind, text in self.records:
+            self.dispatch(kind, text, timestamp)
+        duration = time.time() - start
+        return len(self.records) / duration if duration else 0.0
+
+    def schedule(self, speed=1.0):
+        """
+        Replay the records on the reactor, keeping their relative timing scaled by the speed factor.
+
+        :param speed: replay speed relative to real time
+        :return: Deferred fired once the last record was dispatched
+        """
+        done = defer.Deferred()
+        if not self.records:
+            done.callback(0)
+            return done
+        origin = self.records[0][0]
+        for timestamp, kind, text in self.records:
+            reactor.callLater((timestamp - origin) / speed, self.dispatch, kind, text, timestamp)
+        reactor.callLater((self.records[-1][0] - origin) / speed, done.callback, len(self.records))
+        return done
@@ -0,0 +1,219 @@
+import bisect
+import timeit
+
+from softdev import log
+from twisted.internet import reactor
+from twisted.web import resource, server
+
+logger = log.get_module_logger(__name__)
+
+clock = timeit.default_timer
+
+# histogram bucket upper bounds in seconds
+TIME_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, float('inf'))
+
+
+class Metric(object):
+    kind = 'untyped'
+
+    def __init__(self, name, description, func=None):
+        self.name = name
+        self.description = description
+        self.func = func
+        self._value = 0
+
+    @property
+    def value(self):
+        return self.func() if self.func else self._value
+
+    def samples(self):
+        return [(self.name, '', self.value)]
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, either incremented directly or read from func.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._value += amount
+
+
+class Gauge(Metric):
+    """
+    Current value, either set directly or read from func.
+    """
+    kind = 'gauge'
+
+    def set(self, value):
+        self._value = value
+
+
+class LabelledGauge(Metric):
+    """
+    Current values of several series distinguished by one label, read from func as a dictionary
+    mapping label values to values.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, description, label, func):
+        super(LabelledGauge, self).__init__(name, description, func)
+        self.label = label
+
+    def samples(self):
+        return [
+            (self.name, '{}="{}"'.format(self.label, key), value) for key, value in sorted(self.value.items())
+        ]
+
+
+class LabelledCounter(LabelledGauge):
+    """
+    Monotonically increasing counts of several series distinguished by one label.
+    """
+    kind = 'counter'
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in fixed buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=TIME_BUCKETS):
+        super(Histogram, self).__init__(name, description)
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def value(self):
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self):
+        return list(self.counts)
+
+    def quantile(self, fraction, since=None):
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+
+        :param fraction: quantile between 0 and 1
+        :param since: bucket counts from a previous snapshot, to only consider later observations
+        """
+        counts = self.counts if since is None else [a - b for a, b in zip(self.counts, since)]
+        target = fraction * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if count and cumulative >= target:
+                return bound if bound != float('inf') else self.buckets[-2]
+        return 0.0
+
+    def samples(self):
+        cumulative = 0
+        samples = []
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((
+                '{}_bucket'.format(self.name), 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound)),
+                cumulative
+            ))
+        samples.append(('{}_sum'.format(self.name), '', self.total))
+        samples.append(('{}_count'.format(self.name), '', self.count))
+        return samples
+
+
+class Registry(object):
+    """
+    Collection of metrics sharing a set of constant labels.
+
+    :param labels: dictionary of labels added to every sample, e.g. the device name
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, func=None):
+        return self.add(Counter(name, description, func))
+
+    def gauge(self, name, description, func=None):
+        return self.add(Gauge(name, description, func))
+
+    def labelled_gauge(self, name, description, label, func):
+        return self.add(LabelledGauge(name, description, label, func))
+
+    def labelled_counter(self, name, description, label, func):
+        return self.add(LabelledCounter(name, description, label, func))
+
+    def histogram(self, name, description, buckets=TIME_BUCKETS):
+        return self.add(Histogram(name, description, buckets))
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        return render([self])
+
+
+def render(registries):
+    """
+    Render several registries in the Prometheus text exposition format, grouping the samples of
+    each metric name together.
+    """
+    families = []
+    grouped = {}
+    for registry in registries:
+        base = ','.join('{}="{}"'.format(key, value) for key, value in sorted(registry.labels.items()))
+        for metric in registry.metrics:
+            if metric.name not in grouped:
+                grouped[metric.name] = []
+                families.append(metric)
+            grouped[metric.name].append((base, metric))
+
+    lines = []
+    for family in families:
+        lines.append('# HELP {} {}'.format(family.name, family.description))
+        lines.append('# TYPE {} {}'.format(family.name, family.kind))
+        for base, metric in grouped[family.name]:
+            for name, extra, value in metric.samples():
+                labels = ','.join(filter(None, [base, extra]))
+                lines.append('{}{{{}}} {}'.format(name, labels, value) if labels else '{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(resource.Resource):
+    """
+    Web resource serving one or more registries as Prometheus text.
+    """
+    isLeaf = True
+
+    def __init__(self, registries):
+        resource.Resource.__init__(self)
+        self.registries = registries
+
+    def render_GET(self, request):
+        request.setHeader(b'content-type', b'text/plain; version=0.0.4')
+        return render(self.registries).encode('utf-8')
+
+
+def serve(registries, port, interface='127.0.0.1'):
+    """
+    Serve registries on a local HTTP endpoint for scraping.
+
+    :param registries: list of Registry instances
+    :param port: TCP port
+    :param interface: interface to listen on, localhost by default
+    """
+    logger.info('Serving metrics on http://{}:{}/metrics'.format(interface, port))
+    return reactor.listenTCP(port, server.Site(MetricsResource(registries)), interface=interface)
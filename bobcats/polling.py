@@ -0,0 +1,112 @@
+import time
+
+ACTIVE_HOLD = 5.0       # seconds to keep polling fast after a command is sent
+REPLY_TIMEOUT = 2.0     # seconds to wait for a reply before asking again
+FRESH_FRACTION = 0.5    # fraction of the interval during which a reply is fresh enough to skip a query
+EARLY = 0.01            # seconds a query may be sent ahead of its interval, absorbs timer jitter
+
+
+class Query(object):
+    """
+    A periodic status query.
+
+    :param name: query sent to the controller, also the context of its reply
+    :param active: polling interval in seconds while the robot is busy
+    :param idle: polling interval in seconds while the robot is idle
+    :param priority: lower numbers are polled first when several queries are due
+    """
+
+    def __init__(self, name, active, idle, priority=0):
+        self.name = name
+        self.active = active
+        self.idle = idle
+        self.priority = priority
+        self.sent = 0
+        self.replied = 0
+
+    def interval(self, busy):
+        return self.active if busy else self.idle
+
+    def is_due(self, now, busy):
+        """
+        Check if the query should be sent. Queries are due one interval after they were last sent. A
+        query is skipped while a reply to a previous request is outstanding, or while its last reply is
+        still fresh.
+        """
+        interval = self.interval(busy)
+        if self.sent > self.replied and now - self.sent < REPLY_TIMEOUT:
+            return False
+        if now - self.replied < interval * FRESH_FRACTION:
+            return False
+        return now - self.sent >= interval - EARLY
+
+
+# Default status queries
+QUERIES = (
+    Query('state', active=0.1, idle=1.0, priority=0),
+    Query('di', active=0.2, idle=2.0, priority=1),
+    Query('do', active=0.2, idle=2.0, priority=1),
+    Query('position', active=0.2, idle=5.0, priority=2),
+    Query('message', active=1.0, idle=5.0, priority=3),
+    Query('ventil', active=10.0, idle=10.0, priority=4),
+    Query('config', active=30.0, idle=30.0, priority=4),
+)
+
+
+class PollScheduler(object):
+    """
+    Decides which status query to send next. Queries are polled at their active rate while the robot
+    is running a path or a command was sent recently, and back off to their idle rate otherwise.
+    """
+
+    def __init__(self, queries=QUERIES):
+        self.queries = sorted(
+            [Query(q.name, q.active, q.idle, q.priority) for q in queries], key=lambda q: q.priority
+        )
+        self.index = {query.name: query for query in self.queries}
+        self.running = False
+        self.active_until = 0
+
+    def reset(self):
+        """
+        Forget all send and reply times so that every query is due immediately.
+        """
+        for query in self.queries:
+            query.sent = query.replied = 0
+
+    def is_busy(self, now=None):
+        now = time.time() if now is None else now
+        return self.running or now < self.active_until
+
+    def wake(self, now=None):
+        """
+        Switch to fast polling because a command was just sent.
+        """
+        now = time.time() if now is None else now
+        self.active_until = now + ACTIVE_HOLD
+
+    def set_running(self, running):
+        self.running = bool(running)
+
+    def due_queries(self, now=None):
+        """
+        Pick all queries which are due, in priority order, and mark them as sent.
+
+        :return: list of query names
+        """
+        now = time.time() if now is None else now
+        busy = self.is_busy(now)
+        due = []
+        for query in self.queries:
+            if query.is_due(now, busy):
+                query.sent = now
+                due.append(query.name)
+        return due
+
+    def replied(self, name, now=None):
+        """
+        Record the arrival of a reply for the named query.
+        """
+        query = self.index.get(name)
+        if query:
+            query.replied = time.time() if now is None else now
@@ -0,0 +1,183 @@
+from softdev import log
+
+from .cats import CommandStats
+from .derived import mounted_port
+
+logger = log.get_module_logger(__name__)
+
+# trajectory commands which are profiled
+PROFILED_COMMANDS = ('put', 'get', 'getput', 'putplate', 'getplate', 'getputplate')
+
+# phases of an operation, in order
+PHASES = ('start', 'travel', 'prepare', 'approach', 'return')
+
+START_TIMEOUT = 30.0    # seconds after which an operation whose path never started is discarded
+
+# flags marking the prepare and approach phases, also the names of the I/O bits which can provide them
+SAFETY_FLAGS = ('prepare', 'approach')
+
+
+class Operation(object):
+    """
+    One profiled trajectory, from the command until the path ends.
+
+    :param name: command name
+    :param timestamp: time the command was sent
+    """
+
+    def __init__(self, name, timestamp):
+        self.name = name
+        self.started = timestamp
+        self.phase = 'start'
+        self.phase_start = timestamp
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.running = False
+        self.visited = False    # the diffractometer was approached or its sample changed
+        self.mounted = None
+
+    def enter(self, phase, timestamp):
+        if phase != self.phase:
+            self.durations[self.phase] += timestamp - self.phase_start
+            self.phase = phase
+            self.phase_start = timestamp
+
+
+class CycleProfiler(object):
+    """
+    Splits put, get and exchange trajectories into phases from the command stream, the decoded state
+    and the prepare and approach flags, and keeps duration statistics for each command and phase:
+
+    - start: from the command until the path runs
+    - travel: lid opening, picking and gripper travel until the diffractometer is prepared
+    - prepare: SAFETY:PREPARE is set
+    - approach: SAFETY:APPROACH is set, exchange at the diffractometer
+    - return: after the diffractometer, until the path ends
+
+    The flags come from the SAFETY:PREPARE and SAFETY:APPROACH PVs, which are written by the beamline,
+    or from I/O bits named prepare and approach in the bit map. Without either, the prepare and
+    approach phases stay at zero and are counted as travel and return.
+
+    :param app: BobCATSApp instance
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.operation = None
+        self.stats = {}
+        self.totals = {}
+        self.safety = dict.fromkeys(SAFETY_FLAGS, 0)
+
+    def reset(self):
+        self.operation = None
+
+    def command_sent(self, command):
+        name = command.split('(', 1)[0].strip()
+        if name in PROFILED_COMMANDS:
+            if self.operation is not None:
+                logger.debug('Profile of {} abandoned for {}'.format(self.operation.name, name))
+            self.operation = Operation(name, self.app.clock())
+
+    def command_failed(self, command, reason):
+        # a rejected or unanswered command never starts a path
+        operation = self.operation
+        if operation is not None and not operation.running and command.split('(', 1)[0].strip() == operation.name:
+            logger.info('Profile of {} discarded: {}'.format(operation.name, reason))
+            self.operation = None
+
+    def check(self):
+        # discard an operation whose path never started, called for every state reply
+        operation = self.operation
+        if operation is not None and not operation.running and self.app.clock() - operation.started > START_TIMEOUT:
+            logger.warning('Profile of {} discarded, path did not start'.format(operation.name))
+            self.operation = None
+
+    def set_safety(self, name, value):
+        """
+        Follow the prepare and approach flags.
+
+        :param name: 'prepare' or 'approach'
+        :param value: flag value
+        """
+        self.safety[name] = value
+        if self.operation is not None and self.operation.running:
+            self.classify(self.app.parser.snapshot, self.app.clock())
+
+    def update(self, state):
+        """
+        Follow the robot state during an operation.
+
+        :param state: StatusSnapshot of the decoded state fields
+        """
+        operation = self.operation
+        if operation is None:
+            return
+        now = state.timestamp
+        running = state.get('running_fbk')
+        if not operation.running:
+            if running:
+                operation.running = True
+                operation.mounted = mounted_port(state)
+                self.classify(state, now)
+        elif running:
+            self.classify(state, now)
+        else:
+            operation.enter(None, now)    # close the last phase
+            self.finish(operation, now)
+
+    def classify(self, state, timestamp):
+        operation = self.operation
+        if mounted_port(state) != operation.mounted:
+            operation.visited = True
+        if self.safety['approach']:
+            operation.visited = True
+            phase = 'approach'
+        elif self.safety['prepare']:
+            phase = 'prepare'
+        elif operation.visited:
+            phase = 'return'
+        else:
+            phase = 'travel'
+        operation.enter(phase, timestamp)
+
+    def finish(self, operation, timestamp):
+        self.operation = None
+        total = timestamp - operation.started
+        self.totals.setdefault(operation.name, CommandStats()).add(total)
+        for phase, duration in operation.durations.items():
+            self.stats.setdefault((operation.name, phase), CommandStats()).add(duration)
+        logger.info('{} took {:0.1f} s: {}'.format(
+            operation.name, total, ', '.join('{} {:0.1f}'.format(phase, operation.durations[phase]) for phase in PHASES)
+        ))
+        self.publish(operation, total)
+
+    def publish(self, operation, total):
+        ioc = self.app.ioc
+        ioc.profile_command.put(operation.name)
+        ioc.profile_total.put(total)
+        for phase in PHASES:
+            getattr(ioc, 'profile_{}'.format(phase)).put(operation.durations[phase])
+        stats = self.totals[operation.name]
+        ioc.profile_count.put(stats.count)
+        ioc.profile_mean.put(stats.mean)
+
+    def has_data(self):
+        return bool(self.totals)
+
+    def summary(self):
+        """
+        Table of the mean total and phase durations of each profiled command.
+
+        :return: report text
+        """
+        lines = ['{:<12} {:>5} {:>8} {:>8} {}'.format(
+            'command', 'count', 'mean', 'p95', ' '.join('{:>8}'.format(phase) for phase in PHASES)
+        )]
+        for name in PROFILED_COMMANDS:
+            stats = self.totals.get(name)
+            if stats is None:
+                continue
+            lines.append('{:<12} {:>5} {:>8.1f} {:>8.1f} {}'.format(
+                name, stats.count, stats.mean, stats.percentile(95),
+                ' '.join('{:>8.1f}'.format(self.stats[(name, phase)].mean) for phase in PHASES)
+            ))
+        return '\n'.join(lines)
@@ -0,0 +1,202 @@
+import time
+from collections import deque, OrderedDict
+from threading import Lock
+
+MAX_OUTBOX = 32     # maximum number of queued commands
+MAX_INBOX = 64      # maximum number of queued droppable messages
+
+# command priority classes, lower values are sent first
+SAFETY, CONTROL, MOTION = range(3)
+PRIORITIES = {
+    'abort': SAFETY, 'pause': SAFETY, 'off': SAFETY,
+    'put': MOTION, 'get': MOTION, 'getput': MOTION, 'putplate': MOTION, 'getplate': MOTION,
+    'getputplate': MOTION, 'home': MOTION, 'back': MOTION, 'toolcal': MOTION, 'adjust': MOTION,
+    'plateangle': MOTION, 'focus': MOTION, 'expose': MOTION, 'collect': MOTION,
+}
+
+
+def command_priority(message):
+    return PRIORITIES.get(message.split('(', 1)[0].strip(), CONTROL)
+
+
+class QueuedCommand(object):
+    __slots__ = ('message', 'priority', 'queued')
+
+    def __init__(self, message, priority):
+        self.message = message
+        self.priority = priority
+        self.queued = time.time()
+
+    @property
+    def wait(self):
+        return time.time() - self.queued
+
+
+class CommandQueue(object):
+    """
+    Bounded, thread-safe command outbox. Commands are dequeued by priority class and in arrival order
+    within a class. A command identical to one which is already waiting is coalesced with it. Queuing
+    a safety command discards the waiting motion commands, so that they are not sent right after it.
+
+    :param depth: maximum number of queued commands
+    """
+
+    def __init__(self, depth=MAX_OUTBOX):
+        self.depth = depth
+        self.queues = [deque() for i in range(MOTION + 1)]
+        self.waiting = set()
+        self.lock = Lock()
+        self.coalesced = 0
+        self.dropped = 0
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def put(self, message):
+        """
+        Add a command to the queue. When the queue is full, safety commands displace the newest
+        command of the lowest priority class, other commands are rejected.
+
+        :param message: formatted command
+        :return: False if the command was rejected
+        """
+        priority = command_priority(message)
+        with self.lock:
+            if priority == SAFETY:
+                self._flush(MOTION)
+            if message in self.waiting:
+                self.coalesced += 1
+                return True
+            if len(self.waiting) >= self.depth:
+                if priority != SAFETY:
+                    self.dropped += 1
+                    return False
+                for queue in reversed(self.queues):
+                    if queue:
+                        self.waiting.discard(queue.pop().message)
+                        self.dropped += 1
+                        break
+            self.queues[priority].append(QueuedCommand(message, priority))
+            self.waiting.add(message)
+        return True
+
+    def peek(self):
+        """
+        Return the next command without removing it, or None if the queue is empty.
+        """
+        with self.lock:
+            for queue in self.queues:
+                if queue:
+                    return queue[0]
+
+    def get(self):
+        """
+        Remove and return the next command, or None if the queue is empty.
+        """
+        with self.lock:
+            for queue in self.queues:
+                if queue:
+                    command = queue.popleft()
+                    self.waiting.discard(command.message)
+                    return command
+
+    def _flush(self, priority):
+        queue = self.queues[priority]
+        count = len(queue)
+        for command in queue:
+            self.waiting.discard(command.message)
+        queue.clear()
+        self.flushed += count
+        return count
+
+    def flush(self, priority):
+        """
+        Discard all waiting commands of a priority class.
+
+        :param priority: SAFETY, CONTROL or MOTION
+        :return: number of discarded commands
+        """
+        with self.lock:
+            return self._flush(priority)
+
+    def clear(self):
+        with self.lock:
+            for queue in self.queues:
+                queue.clear()
+            self.waiting.clear()
+
+
+class InboxMessage(object):
+    __slots__ = ('message', 'message_type', 'arrived')
+
+    def __init__(self, message, message_type):
+        self.message = message
+        self.message_type = message_type
+        self.arrived = time.time()
+
+    @property
+    def age(self):
+        return time.time() - self.arrived
+
+
+class MessageInbox(object):
+    """
+    Bounded inbox for received messages. Messages with a key, such as status replies keyed by their
+    context, are droppable: only the newest message for each key is kept and the oldest ones are
+    dropped beyond the depth limit. Messages without a key are never dropped and are delivered first.
+
+    :param depth: maximum number of droppable messages
+    """
+
+    def __init__(self, depth=MAX_INBOX):
+        self.depth = depth
+        self.messages = deque()
+        self.latest = OrderedDict()
+        self.dropped = 0
+        self.max_depth = 0
+        self.max_age = 0.0
+
+    def __len__(self):
+        return len(self.messages) + len(self.latest)
+
+    def put(self, message, message_type, key=None):
+        """
+        Add a message to the inbox.
+
+        :param message: message text
+        :param message_type: message type
+        :param key: messages with the same key replace each other, None if the message may not be dropped
+        """
+        item = InboxMessage(message, message_type)
+        if key is None:
+            self.messages.append(item)
+        else:
+            if self.latest.pop(key, None) is not None:
+                self.dropped += 1
+            elif len(self.latest) >= self.depth:
+                self.latest.popitem(last=False)
+                self.dropped += 1
+            self.latest[key] = item
+        self.max_depth = max(self.max_depth, len(self))
+
+    def get(self):
+        """
+        Remove and return the next message, or None if the inbox is empty.
+        """
+        if self.messages:
+            item = self.messages.popleft()
+        elif self.latest:
+            item = self.latest.popitem(last=False)[1]
+        else:
+            return None
+        self.max_age = max(self.max_age, item.age)
+        return item
+
+    def clear(self):
+        self.messages.clear()
+        self.latest.clear()
+
+    def reset_stats(self):
+        self.max_depth = len(self)
+        self.max_age = 0.0
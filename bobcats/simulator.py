@@ -0,0 +1,243 @@
+import random
+import re
+import time
+
+from softdev import log
+from twisted.internet import reactor, protocol
+from twisted.protocols.basic import LineReceiver
+
+logger = log.get_module_logger(__name__)
+
+MOUNT_TIME = 20.0       # seconds for a put or get trajectory
+NUM_INPUTS = 40
+NUM_OUTPUTS = 40
+HOME_POSITION = (0.0, 300.0, 500.0, 180.0, 0.0, 90.0)
+DIFF_POSITION = (450.0, -100.0, 250.0, 180.0, 0.0, 0.0)
+
+TRAJECTORIES = ('put', 'get', 'getput', 'putplate', 'getplate', 'getputplate', 'home', 'back', 'toolcal')
+COMMAND_PATTERN = re.compile(r'^(?P<name>[a-z ]+?)(?P<lid>\d?)(\((?P<args>.*)\))?$')
+
+
+def int_args(args, count):
+    values = [int(float(arg)) for arg in args.split(',')] if args else []
+    return (values + count * [0])[:count]
+
+
+class Robot(object):
+    """
+    Simulated CATS controller state, shared by the command and status ports.
+
+    :param mount_time: duration of a put or get trajectory in seconds
+    """
+
+    def __init__(self, mount_time=MOUNT_TIME):
+        self.mount_time = mount_time
+        self.power = 0
+        self.auto = 1
+        self.default = 1
+        self.tool = 2
+        self.path = ''
+        self.lid_tool = self.sample_tool = 0
+        self.lid_diff = self.sample_diff = 0
+        self.plate = self.well = 0
+        self.barcode = ''
+        self.ln2 = [1, 1]
+        self.speed = 100
+        self.pucks = ['111111111', '000000000']
+        self.dewar_position = [0, 0]
+        self.inputs = [0] * NUM_INPUTS
+        self.outputs = [0] * NUM_OUTPUTS
+        self.lids = [0, 0, 0]
+        self.message = 'Ready'
+        self.config = [1, 1, 0]
+        self.ventil = [0.0, 0.0]
+        self.motion = None
+        self.pending = []
+
+    @property
+    def running(self):
+        return int(self.motion is not None)
+
+    def state(self):
+        # Field order follows status.STATE_FIELDS
+        fields = (
+            self.power, self.auto, self.default, self.tool, self.path, self.lid_tool, self.sample_tool,
+            self.sample_diff, self.lid_diff, self.sample_diff, self.plate, self.well, self.barcode,
+            self.running, self.ln2[0], self.ln2[1], self.speed, self.pucks[0], self.pucks[1],
+            self.dewar_position[0], self.dewar_position[1],
+        )
+        return 'state({})'.format(','.join(str(field) for field in fields))
+
+    def di(self):
+        return 'di({})'.format(','.join(str(bit) for bit in self.inputs))
+
+    def do(self):
+        return 'do({})'.format(','.join(str(bit) for bit in self.outputs))
+
+    def position(self):
+        if self.motion:
+            start, end, source, target = self.motion
+            fraction = min(1.0, (time.time() - start) / (end - start))
+            coords = [a + (b - a) * fraction for a, b in zip(source, target)]
+        else:
+            coords = DIFF_POSITION if self.sample_diff or self.well else HOME_POSITION
+        return 'position({})'.format(','.join('{:0.3f}'.format(coord) for coord in coords))
+
+    def status(self, query):
+        """
+        Reply to a status query.
+
+        :param query: status query name
+        :return: reply text or None for unknown queries
+        """
+        if query == 'state':
+            return self.state()
+        elif query == 'di':
+            return self.di()
+        elif query == 'do':
+            return self.do()
+        elif query == 'position':
+            return self.position()
+        elif query == 'message':
+            return 'message({})'.format(self.message)
+        elif query == 'config':
+            return 'config({})'.format(','.join(str(count) for count in self.config))
+        elif query == 'ventil':
+            return 'ventil({})'.format(','.join('{:0.1f}'.format(value) for value in self.ventil))
+
+    def command(self, message):
+        """
+        Execute a command.
+
+        :param message: command text
+        :return: reply text
+        """
+        m = COMMAND_PATTERN.match(message)
+        if not m:
+            return 'Error: unknown command {}'.format(message)
+        name, lid, args = m.group('name'), m.group('lid'), m.group('args')
+        if name in TRAJECTORIES and not self.power:
+            return 'Error: power is off'
+        if name == 'on':
+            self.power = 1
+        elif name == 'off':
+            self.power = 0
+            self.stop()
+        elif name == 'abort':
+            self.stop()
+        elif name in ('openlid', 'closelid') and lid:
+            self.lids[int(lid) - 1] = int(name == 'openlid')
+        elif name in ('put', 'getput'):
+            tool, lid, sample = int_args(args, 3)
+            self.start(name, lambda: self.mount(lid, sample))
+        elif name == 'get':
+            self.start(name, lambda: self.mount(0, 0))
+        elif name in ('putplate', 'getputplate'):
+            values = int_args(args, 7)
+            self.start(name, lambda: self.mount_plate(values[5], values[6]))
+        elif name == 'getplate':
+            self.start(name, lambda: self.mount_plate(0, 0))
+        elif name in TRAJECTORIES:
+            self.start(name, lambda: None, self.mount_time / 4)
+        return message
+
+    def start(self, path, done, duration=None):
+        duration = self.mount_time if duration is None else duration
+        now = time.time()
+        source = DIFF_POSITION if self.sample_diff or self.well else HOME_POSITION
+        target = DIFF_POSITION if path not in ('get', 'getplate', 'home', 'back') else HOME_POSITION
+        self.stop()
+        self.path = path
+        self.motion = (now, now + duration, source, target)
+        self.pending.append(reactor.callLater(duration, self.finish, done))
+
+    def finish(self, done):
+        done()
+        self.motion = None
+        self.path = ''
+
+    def stop(self):
+        for call in self.pending:
+            if call.active():
+                call.cancel()
+        self.pending = []
+        self.motion = None
+        self.path = ''
+
+    def mount(self, lid, sample):
+        self.lid_diff, self.sample_diff = lid, sample
+
+    def mount_plate(self, plate, well):
+        self.plate, self.well = plate, well
+
+
+class SimulatorProtocol(LineReceiver):
+    def __init__(self, factory):
+        self.factory = factory
+
+    def connectionMade(self):
+        logger.info('{} client connected'.format(self.factory.name))
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        logger.info('{} client disconnected'.format(self.factory.name))
+
+    def lineReceived(self, line):
+        message = line.decode('ascii', 'replace').strip()
+        if message:
+            self.factory.reply(self, message)
+
+
+class SimulatorFactory(protocol.ServerFactory):
+    """
+    Serves one port of the simulated controller.
+
+    :param robot: shared Robot state
+    :param name: 'command' or 'status'
+    :param delay: mean reply delay in seconds
+    :param jitter: maximum random deviation of the reply delay in seconds
+    :param drop: fraction of requests which are silently dropped
+    """
+
+    def __init__(self, robot, name, delay=0.0, jitter=0.0, drop=0.0):
+        self.robot = robot
+        self.name = name
+        self.delay = delay
+        self.jitter = jitter
+        self.drop = drop
+        self.requests = 0
+        self.dropped = 0
+
+    def buildProtocol(self, address):
+        return SimulatorProtocol(self)
+
+    def reply(self, client, message):
+        self.requests += 1
+        if self.drop and random.random() < self.drop:
+            self.dropped += 1
+            return
+        if self.name == 'status':
+            response = self.robot.status(message)
+        else:
+            response = self.robot.command(message)
+        if response is not None:
+            delay = max(0.0, self.delay + random.uniform(-self.jitter, self.jitter))
+            reactor.callLater(delay, self.send, client, response)
+
+    def send(self, client, response):
+        if client.transport and client.connected:
+            client.sendLine(response.encode('ascii'))
+
+
+def serve(command_port, status_port, **kwargs):
+    """
+    Start a simulated controller listening on the given ports.
+
+    :param command_port: command port number
+    :param status_port: status port number
+    :param kwargs: mount_time for the Robot, delay, jitter and drop for the ports
+    :return: simulated Robot
+    """
+    robot = Robot(mount_time=kwargs.pop('mount_time', MOUNT_TIME))
+    reactor.listenTCP(command_port, SimulatorFactory(robot, 'command', **kwargs))
+    reactor.listenTCP(status_port, SimulatorFactory(robot, 'status', **kwargs))
+    return robot
@@ -0,0 +1,258 @@
+import math
+import time
+from collections import defaultdict
+
+from softdev import log
+
+logger = log.get_module_logger(__name__)
+
+
+def zero_int(text):
+    try:
+        return int(text)
+    except ValueError:
+        return 0
+
+
+def binary_int(text):
+    # converts '0,1,1' to 3
+    return int(text.replace(',', ''), 2)
+
+
+# BobCATS attribute and converter of each field of the state reply, in reply order. Fields without an
+# attribute are skipped.
+STATE_FIELDS = (
+    ('power_fbk', int), ('mode_fbk', int), ('default_fbk', int), ('tool_fbk', zero_int), ('path_fbk', str),
+    ('lid_tool_fbk', zero_int), ('sample_tool_fbk', zero_int), (None, None),
+    ('lid_diff_fbk', zero_int), ('sample_diff_fbk', zero_int), ('plate_fbk', zero_int), ('well_fbk', zero_int),
+    ('barcode_fbk', str), ('running_fbk', int), ('ln2_dew1_fbk', int), ('ln2_dew2_fbk', int), ('speed_fbk', int),
+    ('pucks_dew1_fbk', str), ('pucks_dew2_fbk', str), ('pos_dew1_fbk', zero_int), ('pos_dew2_fbk', zero_int),
+)
+
+# BobCATS attributes of the position reply fields, in reply order
+POSITION_FIELDS = ('pos_x_fbk', 'pos_y_fbk', 'pos_z_fbk', 'pos_rx_fbk', 'pos_ry_fbk', 'pos_rz_fbk')
+POSITION_DEADBAND = 0.05    # mm or deg, smaller coordinate changes are not published
+SPEED_DEADBAND = 1.0        # mm/s, smaller speed changes are not published
+
+
+class StatusDecoder(object):
+    """
+    Keeps the last raw text and converted value for every status field and only publishes a field to
+    its process variable when it actually changed.
+    """
+
+    def __init__(self):
+        self.raw = {}
+        self.values = {}
+        self.published = 0
+        self.suppressed = 0
+
+    def reset(self):
+        """
+        Forget all cached fields so that the next reply is published in full.
+        """
+        self.raw.clear()
+        self.values.clear()
+
+    def update(self, key, variable, converter, text):
+        """
+        Convert and publish a raw field if it differs from the previous reply.
+
+        :param key: unique field key
+        :param variable: process variable to publish to
+        :param converter: callable converting the raw text to the PV value
+        :param text: raw field text from the controller
+        :return: True if the PV was updated
+        """
+        if self.raw.get(key) == text:
+            self.suppressed += 1
+            return False
+        value = converter(text)
+        self.raw[key] = text
+        return self.publish(key, variable, value)
+
+    def publish(self, key, variable, value, deadband=0):
+        """
+        Publish an already converted value if it differs from the previous one.
+
+        :param key: unique field key
+        :param variable: process variable to publish to
+        :param value: new value
+        :param deadband: for numeric values, changes smaller than this are not published
+        :return: True if the PV was updated
+        """
+        previous = self.values.get(key)
+        if key in self.values and (previous == value or (deadband and abs(previous - value) < deadband)):
+            self.suppressed += 1
+            return False
+        self.values[key] = value
+        variable.put(value)
+        self.published += 1
+        return True
+
+
+class StatusSnapshot(object):
+    """
+    Immutable copy of all state fields after a complete state reply was decoded.
+
+    :param sequence: number incremented with every new snapshot
+    :param timestamp: time at which the reply was decoded
+    :param fields: dictionary of converted field values, copied
+    """
+    __slots__ = ('sequence', 'timestamp', '_fields')
+
+    def __init__(self, sequence=0, timestamp=0.0, fields=None):
+        object.__setattr__(self, 'sequence', sequence)
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, '_fields', dict(fields or {}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('StatusSnapshot is immutable')
+
+    def __getitem__(self, name):
+        return self._fields[name]
+
+    def __contains__(self, name):
+        return name in self._fields
+
+    def get(self, name, default=None):
+        return self._fields.get(name, default)
+
+    def fields(self):
+        return dict(self._fields)
+
+
+class StatusParser(object):
+    """
+    Decodes status replies of the form ``context(field,field,...)``. Each context is dispatched to a
+    specialised decoder and all PV updates go through a change-suppressing StatusDecoder.
+
+    :param ioc: BobCATS model instance
+    :param decoder: StatusDecoder to publish through, a new one is created if not given
+    :param clock: callable returning the current time, for timestamps and speed estimates
+    """
+
+    def __init__(self, ioc, decoder=None, clock=time.time):
+        self.ioc = ioc
+        self.decoder = decoder or StatusDecoder()
+        self.clock = clock
+        self.state_fields = tuple(
+            (index, name, getattr(ioc, name) if name else None, converter)
+            for index, (name, converter) in enumerate(STATE_FIELDS)
+        )
+        self.state = {}
+        self.snapshot = StatusSnapshot()
+        self.changed = set()
+        self.errors = defaultdict(int)
+        self.position = ()
+        self.position_time = 0
+        self.position_fields = tuple(
+            (('position', index), getattr(ioc, name)) for index, name in enumerate(POSITION_FIELDS)
+        )
+        self.handlers = {
+            'state': self.parse_state,
+            'di': self.parse_inputs,
+            'do': self.parse_outputs,
+            'position': self.parse_position,
+            'message': self.parse_message,
+            'config': self.parse_config,
+            'ventil': self.parse_ventil,
+        }
+
+    def reset(self):
+        self.decoder.reset()
+        self.state.clear()
+        self.snapshot = StatusSnapshot(self.snapshot.sequence + 1, self.clock())
+
+    def parse(self, message):
+        """
+        Decode a status reply.
+
+        :param message: reply text
+        :return: tuple (context, number of changed fields), context is None for malformed replies
+        """
+        start = message.find('(')
+        end = message.rfind(')')
+        if start < 1 or end < start:
+            return None, 0
+        context = message[:start]
+        handler = self.handlers.get(context)
+        if handler is None:
+            return context, 0
+        return context, handler(message[start + 1:end])
+
+    def error(self, name, text):
+        self.errors[name] += 1
+        logger.warning('Unable to parse {}: {}'.format(name, text))
+
+    def parse_state(self, text):
+        # decode the whole reply and swap in a new snapshot before any PV is updated, so that PV
+        # callbacks only ever see consistent values
+        raw = self.decoder.raw
+        updates = []
+        for (index, name, variable, converter), field in zip(self.state_fields, text.split(',')):
+            if name is None:
+                continue
+            if raw.get(index) == field:
+                self.decoder.suppressed += 1
+                continue
+            try:
+                value = converter(field)
+            except ValueError:
+                self.error(name, field)
+                continue
+            raw[index] = field
+            updates.append((index, name, variable, value))
+            self.state[name] = value
+        if updates:
+            self.snapshot = StatusSnapshot(self.snapshot.sequence + 1, self.clock(), self.state)
+
+        changes = 0
+        self.changed = set()
+        for index, name, variable, value in updates:
+            if self.decoder.publish(index, variable, value):
+                self.changed.add(name)
+                changes += 1
+        return changes
+
+    def parse_word(self, key, variable, text):
+        try:
+            return int(self.decoder.update(key, variable, binary_int, text))
+        except ValueError:
+            self.error(key, text)
+            return 0
+
+    def parse_inputs(self, text):
+        return self.parse_word('di', self.ioc.inputs_fbk, text)
+
+    def parse_outputs(self, text):
+        return self.parse_word('do', self.ioc.outputs_fbk, text)
+
+    def parse_position(self, text):
+        now = self.clock()
+        try:
+            position = tuple(float(value) for value in text.split(','))
+        except ValueError:
+            self.error('position', text)
+            return 0
+        changes = 0
+        for (key, variable), value in zip(self.position_fields, position):
+            changes += self.decoder.publish(key, variable, value, POSITION_DEADBAND)
+
+        # estimate speed of the tool from consecutive samples
+        if len(self.position) >= 3 and len(position) >= 3 and now > self.position_time:
+            distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(position[:3], self.position[:3])))
+            speed = distance / (now - self.position_time)
+            changes += self.decoder.publish('speed', self.ioc.pos_speed_fbk, speed, SPEED_DEADBAND)
+        self.position = position
+        self.position_time = now
+        return changes
+
+    def parse_message(self, text):
+        return int(self.decoder.publish('message', self.ioc.message_fbk, text))
+
+    def parse_config(self, text):
+        return int(self.decoder.update('config', self.ioc.config_fbk, str, text))
+
+    def parse_ventil(self, text):
+        return int(self.decoder.update('ventil', self.ioc.ventil_fbk, str, text))
@@ -0,0 +1,9 @@
+from bobcats.cats import split_frames
+
+
+def test_split_frames_native_str():
+    buffer = bytearray(b'state(1,1,1)\r\ndi(0,1)\r\npos')
+    messages = split_frames(buffer)
+    assert messages == ['state(1,1,1)', 'di(0,1)']
+    assert all(type(message) is str for message in messages)
+    assert buffer == bytearray(b'pos')
@@ -0,0 +1,93 @@
+import pytest
+
+from bobcats.commands import (
+    ARGUMENT_SLOTS, COMMAND_LAYOUTS, CommandError, build_command, mount_command, port_args, prepare_mounts,
+    prepare_plates, puck_command
+)
+
+
+def wire_args(command):
+    # 'put(2,1,21)' to ['2', '1', '21']
+    return command[command.index('(') + 1:command.rindex(')')].split(',')
+
+
+@pytest.mark.parametrize('name', sorted(COMMAND_LAYOUTS))
+def test_layout_places_required_arguments(name):
+    length, required = COMMAND_LAYOUTS[name]
+    values = {arg: 100 + i for i, arg in enumerate(required)}
+    command = build_command(name, **values)
+    args = wire_args(command)
+    assert command.startswith('{}('.format(name))
+    assert len(args) == length
+    for arg, value in values.items():
+        assert args[ARGUMENT_SLOTS[arg]] == str(value)
+    assert args.count('0') == length - len(required)
+
+
+@pytest.mark.parametrize('name', sorted(COMMAND_LAYOUTS))
+def test_layout_rejects_missing_arguments(name):
+    with pytest.raises(CommandError):
+        build_command(name, tool=2)
+
+
+def test_puck_mount_wire_format():
+    assert mount_command('L1C1') == 'put(2,1,21,0,0,0,0,0,0,0,0,0,0)'
+    assert mount_command('L2A3', occupied='L1C1') == 'getput(2,2,3,0,0,0,0,0,0,0,0,0,0)'
+
+
+def test_plate_mount_wire_format():
+    assert mount_command('P1A1', plate_type=1) == 'putplate(3,0,0,0,0,1,1,1)'
+    assert mount_command('P2B1', occupied='P1A1', plate_type=1) == 'getputplate(3,0,0,0,0,2,25,1,0)'
+
+
+def test_puck_command_checks_ranges():
+    with pytest.raises(CommandError):
+        puck_command('put', 2, 4, 1)
+    with pytest.raises(CommandError):
+        puck_command('put', 2, 1, 31)
+    with pytest.raises(CommandError):
+        puck_command('put', 3, 1, 1)
+
+
+@pytest.mark.parametrize('port', ['L1A11', 'L1C01', 'L4A1', 'P9A1', 'X1A1', '', None, ['L1A1']])
+def test_port_args_rejects_invalid_ports(port):
+    with pytest.raises(CommandError):
+        port_args(port)
+
+
+def test_port_args_canonical():
+    assert port_args('L1C1') == {'tool': 2, 'lid': 1, 'sample': 21, 'mode': 'puck'}
+
+
+def test_prepare_mounts_chains_exchanges():
+    batch = prepare_mounts(['L1A1', 'L1A2', 'P1A1', 'P1A2'])
+    assert batch.errors == {}
+    assert [command.split('(')[0] for command in batch.commands] == [
+        'put', 'getput', 'putplate', 'getputplate'
+    ]
+
+
+def test_prepare_mounts_starts_from_mounted_sample():
+    batch = prepare_mounts(['L1A1'], mounted='L2A1')
+    assert batch.commands == ['getput(2,1,1,0,0,0,0,0,0,0,0,0,0)']
+
+
+def test_prepare_mounts_reports_invalid_ports():
+    batch = prepare_mounts(['L1A1', 'L1A11', 'L1A2'])
+    assert batch.commands[0].startswith('put(')
+    assert batch.commands[1] is None
+    assert batch.commands[2].startswith('getput(')
+    assert list(batch.errors) == [1]
+    assert 'L1A11' in batch.errors[1]
+
+
+def test_prepare_plates_reports_invalid_wells():
+    batch = prepare_plates([
+        {'plate': 1, 'well': 1, 'plate_type': 0},
+        {'plate': 1, 'well': 193, 'plate_type': 0},
+        {'plate': 2, 'well': 5, 'plate_type': 1, 'drop': 1},
+    ])
+    assert batch.commands[0] == 'putplate(3,0,0,0,0,1,1,0)'
+    assert batch.commands[1] is None
+    assert batch.commands[2] == 'getputplate(3,0,0,0,0,2,5,1,1)'
+    assert list(batch.errors) == [1]
@@ -0,0 +1,83 @@
+from bobcats.polling import ACTIVE_HOLD, QUERIES, REPLY_TIMEOUT, PollScheduler, Query
+
+T0 = 1000.0
+TEST_QUERIES = (Query('b', active=0.2, idle=2.0, priority=1), Query('a', active=0.1, idle=1.0, priority=0))
+
+
+def poll(scheduler, now):
+    # send the due queries and answer them immediately
+    due = scheduler.due_queries(now)
+    for name in due:
+        scheduler.replied(name, now)
+    return due
+
+
+def test_all_queries_due_after_reset_in_priority_order():
+    scheduler = PollScheduler()
+    scheduler.reset()
+    due = scheduler.due_queries(T0)
+    assert due == [query.name for query in sorted(QUERIES, key=lambda q: q.priority)]
+    assert due[0] == 'state'
+
+
+def test_idle_intervals_measured_from_send_time():
+    scheduler = PollScheduler(TEST_QUERIES)
+    assert poll(scheduler, T0) == ['a', 'b']
+    assert poll(scheduler, T0 + 0.5) == []
+    assert poll(scheduler, T0 + 1.0) == ['a']
+    assert poll(scheduler, T0 + 1.5) == []
+    assert poll(scheduler, T0 + 2.0) == ['a', 'b']
+
+
+def test_slow_reply_does_not_delay_next_query():
+    scheduler = PollScheduler(TEST_QUERIES)
+    scheduler.due_queries(T0)
+    scheduler.replied('a', T0 + 0.3)
+    assert 'a' in scheduler.due_queries(T0 + 1.0)
+
+
+def test_active_polling_after_wake():
+    scheduler = PollScheduler(TEST_QUERIES)
+    scheduler.wake(T0)
+    assert scheduler.is_busy(T0 + 1.0)
+    assert poll(scheduler, T0) == ['a', 'b']
+    assert poll(scheduler, T0 + 0.1) == ['a']
+    assert poll(scheduler, T0 + 0.2) == ['a', 'b']
+    assert not scheduler.is_busy(T0 + ACTIVE_HOLD + 0.1)
+
+
+def test_active_polling_while_running():
+    scheduler = PollScheduler(TEST_QUERIES)
+    scheduler.set_running(1)
+    assert scheduler.is_busy(T0)
+    assert poll(scheduler, T0) == ['a', 'b']
+    assert poll(scheduler, T0 + 0.1) == ['a']
+    scheduler.set_running(0)
+    assert poll(scheduler, T0 + 0.2) == []
+
+
+def test_outstanding_query_is_repeated_after_reply_timeout():
+    scheduler = PollScheduler(TEST_QUERIES)
+    scheduler.due_queries(T0)
+    assert 'a' not in scheduler.due_queries(T0 + 1.0)
+    assert 'a' in scheduler.due_queries(T0 + REPLY_TIMEOUT)
+
+
+def test_fresh_reply_skips_query():
+    scheduler = PollScheduler(TEST_QUERIES)
+    poll(scheduler, T0)
+    scheduler.replied('a', T0 + 0.9)
+    assert 'a' not in scheduler.due_queries(T0 + 1.0)
+    assert 'a' in scheduler.due_queries(T0 + 1.4)
+
+
+def test_timer_jitter_tolerated():
+    scheduler = PollScheduler(TEST_QUERIES)
+    poll(scheduler, T0)
+    assert poll(scheduler, T0 + 0.995) == ['a']
+
+
+def test_unknown_reply_ignored():
+    scheduler = PollScheduler(TEST_QUERIES)
+    scheduler.replied('unknown', T0)
+    assert poll(scheduler, T0) == ['a', 'b']
@@ -0,0 +1,97 @@
+from bobcats.queues import CONTROL, MOTION, SAFETY, CommandQueue, MessageInbox, command_priority
+
+
+def drain(queue):
+    messages = []
+    command = queue.get()
+    while command:
+        messages.append(command.message)
+        command = queue.get()
+    return messages
+
+
+def test_command_priority():
+    assert command_priority('abort') == SAFETY
+    assert command_priority('put(2,1,1)') == MOTION
+    assert command_priority('openlid1') == CONTROL
+
+
+def test_commands_ordered_by_priority_then_arrival():
+    queue = CommandQueue()
+    for message in ('home(2)', 'openlid1', 'back(2)', 'closelid1'):
+        queue.put(message)
+    assert queue.peek().message == 'openlid1'
+    assert drain(queue) == ['openlid1', 'closelid1', 'home(2)', 'back(2)']
+    assert queue.get() is None
+    assert len(queue) == 0
+
+
+def test_identical_commands_coalesce():
+    queue = CommandQueue()
+    assert queue.put('home(2)')
+    assert queue.put('home(2)')
+    assert len(queue) == 1
+    assert queue.coalesced == 1
+    queue.get()
+    assert queue.put('home(2)')
+    assert len(queue) == 1
+
+
+def test_safety_command_flushes_motion():
+    queue = CommandQueue()
+    queue.put('put(2,1,1)')
+    queue.put('openlid1')
+    queue.put('home(2)')
+    queue.put('abort')
+    assert queue.flushed == 2
+    assert drain(queue) == ['abort', 'openlid1']
+
+
+def test_full_queue_rejects_commands():
+    queue = CommandQueue(depth=2)
+    assert queue.put('openlid1')
+    assert queue.put('openlid2')
+    assert not queue.put('openlid3')
+    assert queue.dropped == 1
+    assert len(queue) == 2
+
+
+def test_full_queue_makes_room_for_safety():
+    queue = CommandQueue(depth=2)
+    queue.put('openlid1')
+    queue.put('openlid2')
+    assert queue.put('pause')
+    assert queue.dropped == 1
+    assert drain(queue) == ['pause', 'openlid1']
+
+
+def test_inbox_keeps_newest_per_key():
+    inbox = MessageInbox()
+    inbox.put('state(1)', 'status', 'state')
+    inbox.put('di(0)', 'status', 'di')
+    inbox.put('state(2)', 'status', 'state')
+    assert len(inbox) == 2
+    assert inbox.dropped == 1
+    assert [inbox.get().message, inbox.get().message] == ['di(0)', 'state(2)']
+    assert inbox.get() is None
+
+
+def test_inbox_delivers_unkeyed_first_and_never_drops_them():
+    inbox = MessageInbox(depth=1)
+    inbox.put('state(1)', 'status', 'state')
+    inbox.put('put(2,1,1)', 'response')
+    inbox.put('put(2,1,2)', 'response')
+    inbox.put('di(0)', 'status', 'di')
+    assert inbox.dropped == 1
+    assert [inbox.get().message for i in range(3)] == ['put(2,1,1)', 'put(2,1,2)', 'di(0)']
+    assert inbox.max_depth == 3
+
+
+def test_inbox_tracks_message_age():
+    inbox = MessageInbox()
+    inbox.put('state(1)', 'status', 'state')
+    inbox.get()
+    assert inbox.max_age >= 0.0
+    inbox.reset_stats()
+    assert inbox.max_age == 0.0
+    assert inbox.max_depth == 0
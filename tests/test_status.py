@@ -0,0 +1,146 @@
+import pytest
+
+from bobcats.status import STATE_FIELDS, StatusParser, binary_int, zero_int
+
+
+class Variable(object):
+    def __init__(self):
+        self.values = []
+
+    def put(self, value):
+        self.values.append(value)
+
+    def get(self):
+        return self.values[-1] if self.values else None
+
+
+class FakeIOC(object):
+    # creates a recording process variable for every attribute used by the parser
+    def __init__(self):
+        self.variables = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.variables.setdefault(name, Variable())
+
+
+STATE = ['1', '1', '1', '2', 'put', '1', '12', '99', '2', '5', '0', '0', 'CODE', '1', '1', '0', '80',
+         '111000000', '000000000', '3', '']
+
+
+def state_reply(fields=STATE):
+    return 'state({})'.format(','.join(fields))
+
+
+@pytest.fixture
+def parser():
+    return StatusParser(FakeIOC())
+
+
+def test_state_fields_decoded(parser):
+    context, changes = parser.parse(state_reply())
+    ioc = parser.ioc
+    assert context == 'state'
+    assert changes == len([name for name, converter in STATE_FIELDS if name])
+    assert ioc.power_fbk.get() == 1
+    assert ioc.tool_fbk.get() == 2
+    assert ioc.path_fbk.get() == 'put'
+    assert ioc.lid_tool_fbk.get() == 1
+    assert ioc.sample_tool_fbk.get() == 12
+    assert ioc.barcode_fbk.get() == 'CODE'
+    assert ioc.speed_fbk.get() == 80
+    assert ioc.pos_dew2_fbk.get() == 0
+
+
+def test_state_field_seven_is_skipped(parser):
+    parser.parse(state_reply())
+    assert parser.ioc.lid_diff_fbk.get() == 2
+    assert parser.ioc.sample_diff_fbk.get() == 5
+    fields = list(STATE)
+    fields[7] = '42'
+    assert parser.parse(state_reply(fields)) == ('state', 0)
+
+
+def test_unchanged_state_is_suppressed(parser):
+    parser.parse(state_reply())
+    puts = len(parser.ioc.power_fbk.values)
+    fields = list(STATE)
+    fields[16] = '50'
+    assert parser.parse(state_reply(fields)) == ('state', 1)
+    assert parser.changed == {'speed_fbk'}
+    assert len(parser.ioc.power_fbk.values) == puts
+    assert parser.parse(state_reply(fields)) == ('state', 0)
+
+
+def test_snapshot_is_versioned_and_immutable(parser):
+    parser.parse(state_reply())
+    first = parser.snapshot
+    assert first['running_fbk'] == 1
+    fields = list(STATE)
+    fields[13] = '0'
+    parser.parse(state_reply(fields))
+    assert parser.snapshot.sequence == first.sequence + 1
+    assert first['running_fbk'] == 1
+    assert parser.snapshot['running_fbk'] == 0
+    with pytest.raises(AttributeError):
+        first.sequence = 0
+
+
+def test_malformed_state_field_counted(parser):
+    fields = list(STATE)
+    fields[0] = 'x'
+    context, changes = parser.parse(state_reply(fields))
+    assert parser.errors['power_fbk'] == 1
+    assert parser.ioc.mode_fbk.get() == 1
+    assert 'power_fbk' not in parser.snapshot
+
+
+@pytest.mark.parametrize('message', ['state', 'state(1,2', '(1,2)', ''])
+def test_malformed_reply(parser, message):
+    assert parser.parse(message) == (None, 0)
+
+
+def test_unknown_context_ignored(parser):
+    assert parser.parse('unknown(1,2)') == ('unknown', 0)
+
+
+def test_digital_words(parser):
+    assert parser.parse('di(0,1,1)') == ('di', 1)
+    assert parser.ioc.inputs_fbk.get() == 3
+    assert parser.parse('di(0,1,1)') == ('di', 0)
+    assert parser.parse('do(1,0,0)') == ('do', 1)
+    assert parser.ioc.outputs_fbk.get() == 4
+
+
+def test_text_replies(parser):
+    assert parser.parse('message(Ready)') == ('message', 1)
+    assert parser.ioc.message_fbk.get() == 'Ready'
+    assert parser.parse('config(1,1,0)') == ('config', 1)
+    assert parser.ioc.config_fbk.get() == '1,1,0'
+    assert parser.parse('ventil(0.0,0.0)') == ('ventil', 1)
+    assert parser.parse('ventil(0.0,0.0)') == ('ventil', 0)
+
+
+def test_position_deadband(parser):
+    assert parser.parse('position(1.0,2.0,3.0,0.0,0.0,0.0)')[1] == 6
+    assert parser.ioc.pos_x_fbk.get() == 1.0
+    parser.parse('position(1.01,2.0,3.0,0.0,0.0,0.0)')
+    assert parser.ioc.pos_x_fbk.values == [1.0]
+    parser.parse('position(1.5,2.0,3.0,0.0,0.0,0.0)')
+    assert parser.ioc.pos_x_fbk.values == [1.0, 1.5]
+    assert parser.ioc.pos_y_fbk.values == [2.0]
+
+
+def test_position_speed():
+    times = iter([10.0, 12.0])
+    parser = StatusParser(FakeIOC(), clock=lambda: next(times))
+    parser.parse('position(0.0,0.0,0.0,0.0,0.0,0.0)')
+    parser.parse('position(3.0,4.0,0.0,0.0,0.0,0.0)')
+    assert parser.ioc.pos_speed_fbk.get() == 2.5
+
+
+def test_converters():
+    assert zero_int('') == 0
+    assert zero_int('7') == 7
+    assert binary_int('1,0,1') == 5